@@ -1,10 +1,16 @@
+import os
+
 import dash
 ##import dash_auth
 import dash_bootstrap_components as dbc
-from dash import html, dcc, callback, Input, Output, State
+from dash import html, dcc, callback, ctx, Input, Output, State
+from flask import request
 
-from auth import verify_login
+from auth import login_blocked, verify_login
+from birdsession import SESSION_COOKIE, SESSION_MAX_AGE, create_session, end_session, session_user
 from login import create_login_form
+from birddatastore import dataset_info, request_refresh, start_refresher
+from birdmetrics import install_metrics
 
 # Initialize Dash app
 app = dash.Dash(__name__,
@@ -34,6 +40,9 @@ app = dash.Dash(__name__,
 # APP SETUP
 # =============================================================================
 
+server = app.server  # WSGI application for gunicorn/uwsgi - see wsgi.py
+install_metrics(app)  # callback timings on /metrics - before the login check, so refused calls count too
+
 # Main layout with authentication control
 app.layout = html.Div([
     dcc.Store(id="session", storage_type="session"),
@@ -45,29 +54,56 @@ app.layout = html.Div([
 # MAIN APP LAYOUT (your existing multi-page setup)
 # =============================================================================
 
+_authenticated_layout = None
+
 def create_authenticated_layout():
-    """Your existing app layout - only shown when authenticated"""
-    return html.Div([
-        html.Div([
-            html.Div(
-                dcc.Link(f"{page['name']} - {page['path']}", href=page["relative_path"])
-            ) for page in dash.page_registry.values()
-        ]),
-        dash.page_container
-    ])
+    """Your existing app layout - only shown when authenticated.
+
+    The same for every user, so it is built once; the pages fill it per visit.
+    """
+    global _authenticated_layout
+    if _authenticated_layout is None:
+        _authenticated_layout = html.Div([
+            html.Div([
+                html.Div(
+                    dcc.Link(f"{page['name']} - {page['path']}", href=page["relative_path"])
+                ) for page in dash.page_registry.values()
+            ]),
+            dash.page_container
+        ])
+    return _authenticated_layout
 
 # =============================================================================
 # AUTHENTICATION CALLBACKS
 # =============================================================================
+# Who is logged in is decided by the signed session cookie (birdsession), the
+# "session" store only tells the browser when to switch between login form and
+# app. Navigation between the pages is handled by dash.page_container and does
+# not re-render the shell.
+
+# callbacks that work without login - everything else needs a valid session
+PUBLIC_CALLBACK_IDS = {"page-content", "session", "login-output"}
+
+@server.before_request
+def require_session():
+    """Refuses data callbacks without a valid session cookie"""
+    if not request.path.endswith("/_dash-update-component"):
+        return None
+    body = request.get_json(silent=True) or {}
+    outputs = str(body.get("output", "")).strip(".").split("...")
+    if all(output.rsplit(".", 1)[0] in PUBLIC_CALLBACK_IDS for output in outputs):
+        return None
+    if session_user(request.cookies.get(SESSION_COOKIE)) is None:
+        return {"error": "not logged in"}, 403
+    return None
 
 @callback(
     Output("page-content", "children"),
-    Input("session", "data"),
-    Input("url", "pathname")
+    Input("session", "data")
 )
-def display_page(session_data, pathname):
+def display_page(session_data):
     """Control what content is shown based on authentication status"""
-    if session_data and session_data.get("authenticated"):
+    if session_user(ctx.cookies.get(SESSION_COOKIE)):
         return create_authenticated_layout()  # Show your multi-page app
     else:
         return create_login_form()  # Show login form
@@ -87,8 +123,17 @@ def handle_login(n_clicks, username, password):
     if not username or not password:
         return dash.no_update, dbc.Alert("Please fill all fields", color="warning")
 
-    if verify_login(username, password):
-        return {"authenticated": True, "username": username}, ""
+    client = request.remote_addr  # rate limit per user name and per client address
+    valid = verify_login(username, password, client)
+    if valid:
+        # the token goes into an HttpOnly cookie - scripts in the page cannot read or change it
+        ctx.response.set_cookie(SESSION_COOKIE, create_session(username), max_age=SESSION_MAX_AGE,
+                                httponly=True, samesite="Lax", secure=request.is_secure)
+        return {"username": username, "login": n_clicks}, ""
+    elif valid is None:
+        return dash.no_update, dbc.Alert("Server busy, please try again in a moment", color="warning")
+    elif login_blocked(username, client):
+        return dash.no_update, dbc.Alert("Too many login attempts, please wait a minute", color="warning")
     else:
         return dash.no_update, dbc.Alert("Invalid credentials", color="danger")
 
@@ -101,13 +146,52 @@ def handle_login(n_clicks, username, password):
 def handle_logout(n_clicks):
     """Handle logout"""
     if n_clicks:
-        return {"authenticated": False}
+        end_session(ctx.cookies.get(SESSION_COOKIE))
+        ctx.response.set_cookie(SESSION_COOKIE, "", max_age=0, httponly=True, samesite="Lax")
+        return {}
     return dash.no_update
 
 
+# =============================================================================
+# DATASET STATUS
+# =============================================================================
+# Only for logged in users - or for scripts sending
+# "Authorization: Bearer <BIRD_DATASET_TOKEN>". Every refresh logs in to the FTP server.
+
+DATASET_TOKEN = os.getenv("BIRD_DATASET_TOKEN")
+
+
+def dataset_access_allowed():
+    if DATASET_TOKEN and request.headers.get("Authorization") == f"Bearer {DATASET_TOKEN}":
+        return True
+    return session_user(request.cookies.get(SESSION_COOKIE)) is not None
+
+
+@app.server.route("/dataset")
+def dataset_status():
+    """Version and build duration of the dataset currently served"""
+    if not dataset_access_allowed():
+        return {"error": "not logged in"}, 403
+    return dataset_info()
+
+
+@app.server.route("/dataset/refresh", methods=["POST"])
+def dataset_refresh():
+    """Asks the background thread to check the FTP workbooks now"""
+    if not dataset_access_allowed():
+        return {"error": "not logged in"}, 403
+    request_refresh()
+    return {"requested": True, **dataset_info()}, 202
+
+
 # =============================================================================
 # RUN APP
 # =============================================================================
 
+# Development server only - in production run `gunicorn wsgi:server`
 if __name__ == '__main__':
-    app.run(debug=True)
+    debug = os.getenv("BIRD_DEBUG", "1") == "1"
+    reload = os.getenv("BIRD_RELOAD", "0") == "1"  # the reloader runs the app in a second process
+    if not reload or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_refresher()  # rebuilds the dataset in the background when the FTP workbooks change
+    app.run(debug=debug, use_reloader=reload, threaded=True)
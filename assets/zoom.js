@@ -0,0 +1,45 @@
+// =============================================================================
+// ZOOMED LEGEND
+// =============================================================================
+// Zooming only changes the legend counts and the title. The page keeps the
+// legend totals of the whole chart (zoom-counts store); after a zoom the
+// server sends the unique birds of the visible bars (zoom-totals store,
+// zoomrange.zoom_totals) and they are put into the legend here.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    birds: {
+        relabel_zoom: function (zoomTotals, resetClicks, counts, figure) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!counts || !figure) {
+                return noUpdate;
+            }
+
+            const triggered = window.dash_clientside.callback_context.triggered;
+            const reset = triggered.some(t => t.prop_id.startsWith('reset-zoom-button'));
+
+            // Zoom range and the totals for it - the whole chart after a reset
+            const range = !reset && zoomTotals && zoomTotals.range ? zoomTotals.range : null;
+            const totals = range ? zoomTotals.totals : counts.totals;
+
+            // Add a 👁️ symbol to indicate counts are for visible (zoomed) area only
+            const prefix = range ? '👁️ ' : '';
+            const data = figure.data.map(trace => (
+                trace.legendgroup in counts.totals
+                    ? Object.assign({}, trace, {name: `${prefix}${trace.legendgroup} (${totals[trace.legendgroup] || 0})`})
+                    : trace
+            ));
+
+            const xaxis = Object.assign({}, figure.layout.xaxis);
+            if (range) {
+                xaxis.range = range;
+                xaxis.autorange = false;
+            } else {
+                delete xaxis.range;
+                xaxis.autorange = true;
+            }
+            const title = Object.assign({}, figure.layout.title, {text: counts.title + (range ? ' (Zoomed View)' : '')});
+
+            return Object.assign({}, figure, {data: data, layout: Object.assign({}, figure.layout, {xaxis: xaxis, title: title})});
+        }
+    }
+});
@@ -1,7 +1,28 @@
 import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
 
-def load_users(path="users.json"):
+USER_FILE = "users.json"
+
+# bcrypt takes 100-300 ms per check - a few threads for it, so logins cannot starve the callbacks
+BCRYPT_WORKERS = int(os.getenv("BIRD_BCRYPT_WORKERS", "2"))
+BCRYPT_QUEUE = int(os.getenv("BIRD_BCRYPT_QUEUE", "0"))  # waiting checks beyond this are refused
+# the request thread waits for its check, so at most half of the request threads of a
+# worker (BIRD_THREADS, see gunicorn.conf.py) may do so - the rest keep serving callbacks
+REQUEST_THREADS = int(os.getenv("BIRD_THREADS", "4"))
+BCRYPT_SLOTS = max(1, min(BCRYPT_WORKERS + BCRYPT_QUEUE, REQUEST_THREADS // 2))
+# attempts per user name and per client address within LOGIN_WINDOW seconds
+LOGIN_ATTEMPTS_USER = int(os.getenv("BIRD_LOGIN_ATTEMPTS_USER", "5"))
+LOGIN_ATTEMPTS_CLIENT = int(os.getenv("BIRD_LOGIN_ATTEMPTS_CLIENT", "20"))
+LOGIN_WINDOW = int(os.getenv("BIRD_LOGIN_WINDOW", "60"))
+LOGIN_KEYS = 10000  # user names / addresses remembered at most, the oldest are forgotten first
+
+def load_users(path=USER_FILE):
     try:
         with open(path, "r") as f:
             return json.load(f)
@@ -12,19 +33,126 @@ def load_users(path="users.json"):
         print(f"Fehler beim Laden der JSON-Datei: {e}")
         return {}
 
-def verify_login(username, password):
-    users = load_users()
-    user = users.get(username)
-    if username not in users:
-        return False, None
-    #print('User: ',user)
-    hashed_pw = user.get("password")
-    #print('Hashed PW: ', hashed_pw)
+# =============================================================================
+# USER STORE
+# =============================================================================
+# users.json is read again only when its modification time changes, e.g.
+# after create_user.py added someone.
+
+_users = {}
+_users_mtime = -1  # not loaded yet
+_users_lock = threading.Lock()
+
+def get_users(path=USER_FILE):
+    """Returns the users, reloading the file only if it changed"""
+    global _users, _users_mtime
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    with _users_lock:
+        if mtime != _users_mtime:
+            _users = load_users(path)
+            _users_mtime = mtime
+        return _users
+
+# =============================================================================
+# RATE LIMITING
+# =============================================================================
+
+class RateLimiter:
+    """Allows `limit` attempts per key within `window` seconds (sliding window)"""
+
+    def __init__(self, limit, window, max_keys=LOGIN_KEYS):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._attempts = {}  # key -> deque of attempt times, in order of the first attempt
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def sweep(self, now):
+        """Drops keys without attempts in the window, then the oldest beyond max_keys - lock held"""
+        if now - self._last_sweep >= self.window:
+            self._last_sweep = now
+            for key in [key for key, attempts in self._attempts.items() if now - attempts[-1] > self.window]:
+                del self._attempts[key]
+        for key in list(self._attempts)[:max(0, len(self._attempts) - self.max_keys)]:
+            del self._attempts[key]
+
+    def blocked(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                return False
+            while attempts and now - attempts[0] > self.window:
+                attempts.popleft()
+            if not attempts:
+                del self._attempts[key]  # keeps the table small
+                return False
+            return len(attempts) >= self.limit
+
+    def record(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._attempts.setdefault(key, deque()).append(now)
+            self.sweep(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+user_limiter = RateLimiter(LOGIN_ATTEMPTS_USER, LOGIN_WINDOW)
+client_limiter = RateLimiter(LOGIN_ATTEMPTS_CLIENT, LOGIN_WINDOW)
+
+def login_blocked(username, client=None):
+    """True if the user name or the client address used up its login attempts"""
+    return user_limiter.blocked(username) or (client is not None and client_limiter.blocked(client))
+
+# =============================================================================
+# PASSWORD CHECK
+# =============================================================================
+
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_slots = threading.BoundedSemaphore(BCRYPT_SLOTS)
+# checked for unknown users, so they take as long as a wrong password - same cost (12) as create_user.py
+_DUMMY_HASH = "$2b$12$Yq.dgRAxu47LhPnn7DStBO6QLL1VSb6yvvjaSUNYoeKeWjjsGYXgu"
+
+def check_password(password, hashed_pw):
+    """bcrypt check in the bounded pool - None if the pool is overloaded"""
     if isinstance(hashed_pw, str):
-        hashed_pw_bytes = hashed_pw.encode('utf-8')
-    else:
-        hashed_pw_bytes = hashed_pw
+        hashed_pw = hashed_pw.encode('utf-8')
+    if not _bcrypt_slots.acquire(blocking=False):
+        print("Anmeldung abgelehnt: zu viele gleichzeitige Passwortprüfungen.")
+        return None
+    try:
+        return _bcrypt_pool.submit(bcrypt.checkpw, password.encode('utf-8'), hashed_pw).result()
+    except ValueError as e:  # broken hash in users.json
+        print(f"Ungültiger Passwort-Hash: {e}")
+        return False
+    finally:
+        _bcrypt_slots.release()
 
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_pw_bytes)
+def verify_login(username, password, client=None):
+    """True only for a known user with the right password, None if the server is too busy to check.
 
+    Unknown users take the same path as a wrong password. Too many attempts also
+    return False - login_blocked() tells them apart. None means the bcrypt pool was
+    full and the password was not checked at all, so it must not be reported as wrong.
+    """
+    if login_blocked(username, client):
+        return False
+    user_limiter.record(username)
+    if client is not None:
+        client_limiter.record(client)
 
+    user = get_users().get(username)
+    hashed_pw = user.get("password") if isinstance(user, dict) else None
+    valid = check_password(password, hashed_pw or _DUMMY_HASH)
+    if valid is None:
+        return None
+    if valid and hashed_pw:
+        user_limiter.reset(username)
+        return True
+    return False
@@ -0,0 +1,109 @@
+import base64
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+# =============================================================================
+# BAR FIGURE BUILDER
+# =============================================================================
+# Builds the bar charts of the pages straight from the aggregated counts as a
+# plain figure dict: one bar trace per bird type, with the settings px.bar(...)
+# and the update_traces calls used to add, and nothing else. plotly's
+# graph_objects validation (copies of every array and setting) is skipped -
+# the dict goes to the figure cache and the browser as it is. Values the
+# browser defaults to anyway (orientation, axis ids, empty pattern, ...) are
+# left out, dates are sent as plain days and the counts as base64 typed
+# arrays - same chart, smaller JSON.
+#
+# legendgroup stays the bare bird type: assets/zoom.js relabels the legend
+# entries by it.
+
+# text above every bar, the same for all traces
+BAR_TEXT = dict(texttemplate='%{y}', textposition='outside', textangle=0, insidetextanchor='middle',
+                textfont=dict(size=12, color='black'))
+
+TYPED_ARRAY_CODES = {'uint8': 'u1', 'uint16': 'u2', 'uint32': 'u4'}
+
+_templates = {}  # template name -> layout.template dict, built once
+
+
+def template(name=None):
+    """The layout.template of the default plotly template, as go.Figure would add it"""
+    name = name or pio.templates.default
+    if name not in _templates:
+        _templates[name] = pio.templates[name].to_plotly_json()
+    return _templates[name]
+
+
+def axis_values(values):
+    """Compact x values: days for dates ('2023-01-01'), everything else unchanged"""
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return np.datetime_as_string(values.to_numpy(dtype='datetime64[D]'), unit='D').astype(object)
+    return values.to_numpy(dtype=object)
+
+
+def count_array(values):
+    """Counts in the smallest unsigned integer type"""
+    values = np.asarray(values)
+    for dtype in TYPED_ARRAY_CODES:
+        if len(values) == 0 or (values.min() >= 0 and values.max() <= np.iinfo(dtype).max):
+            return values.astype(dtype)
+    return values
+
+
+def typed_array(values):
+    """plotly.js typed array ({'dtype', 'bdata'}) - 1 to 4 bytes per count instead of its digits"""
+    code = TYPED_ARRAY_CODES.get(values.dtype.name)
+    if code is None:
+        return values.tolist()
+    return {'dtype': code, 'bdata': base64.b64encode(np.ascontiguousarray(values).tobytes()).decode('ascii')}
+
+
+def bar_figure(df, x, y, color, title, labels, barmode, colors, totals=None, layout=None):
+    """Bar chart with one trace per `color` value, like px.bar(df, x, y, color, ...) plus the bar texts.
+
+    `totals` adds the count per bird type to its legend entry, `layout` holds the
+    page's layout settings - merged with the figure's own in one go.
+    """
+    groups = df[color]
+    order = groups.dropna().drop_duplicates().tolist()  # traces in order of appearance, like px
+    codes = pd.Categorical(groups, categories=order).codes
+    positions = np.argsort(codes, kind='stable')  # rows of each bird type, in the order of df
+    bounds = np.searchsorted(codes[positions], np.arange(len(order) + 1))
+    x_values = axis_values(df[x])
+    y_values = count_array(df[y])
+    totals = totals or {}
+
+    hover = f"{labels.get(color, color)}=%s<br>{labels.get(x, x)}=%%{{x}}<br>{labels.get(y, y)}=%%{{y}}<extra></extra>"
+    traces = []
+    for i, name in enumerate(order):
+        rows = positions[bounds[i]:bounds[i + 1]]
+        trace = {
+            'type': 'bar',
+            'x': x_values[rows].tolist(), 'y': typed_array(y_values[rows]),
+            'name': f"{name} ({totals[name]})" if name in totals else str(name),
+            'legendgroup': str(name),
+            'marker': {'color': colors[i % len(colors)]},
+            'hovertemplate': hover % name,
+            **BAR_TEXT,
+        }
+        if barmode == 'group':  # grouped bars keep a slot per trace on every x value, as px does
+            trace.update(offsetgroup=str(name), alignmentgroup='True')
+        traces.append(trace)
+
+    fig_layout = {
+        'template': template(),
+        'title': {'text': title},
+        'barmode': barmode,
+        'legend': {'title': {'text': labels.get(color, color)}, 'tracegroupgap': 0},
+        'xaxis': {'title': {'text': labels.get(x, x)}},
+        'yaxis': {'title': {'text': labels.get(y, y)}},
+    }
+    for key, value in (layout or {}).items():
+        if isinstance(value, dict) and isinstance(fig_layout.get(key), dict):
+            fig_layout[key] = {**fig_layout[key], **value}
+        else:
+            fig_layout[key] = value
+    return {'data': traces, 'layout': fig_layout}
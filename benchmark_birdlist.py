@@ -0,0 +1,67 @@
+import argparse
+import time
+
+import requests
+
+from birddataload import parse_birdlist, parse_birdlist_soup
+from birdhttp import fetch_text
+
+# =============================================================================
+# BIRD LIST PARSER BENCHMARK
+# =============================================================================
+# Compares the streaming parser with the BeautifulSoup fallback on the club300
+# bird list: both must return exactly the same rows. Without network (and no
+# cached copy) a generated table of the same shape is used.
+#     python benchmark_birdlist.py --runs 5
+
+BIRDLIST_URL = 'https://www.club300.de/publications/wp-bird-list.php'
+
+
+def sample_page(rows):
+    """A page shaped like the club300 list: three header rows, then one row per species"""
+    lines = ['<html><body><table>', '<tr><th>Liste</th></tr>', '<tr><td colspan="5">Stand</td></tr>',
+             '<tr><th>Nr</th><th>Code</th><th>Deutsch</th><th>English</th><th>Latein</th></tr>']
+    for i in range(rows):
+        lines.append(f'<tr>\n  <td>{i}</td><td>X{i}</td><td>Vogel &amp; {i}</td>'
+                     f'<td>Bird {i}<br></td><td><i>Avis</i> nr{i}</td>\n</tr>')
+    lines.append('</table></body></html>')
+    return '\n'.join(lines)
+
+
+def best_of(parse, html, runs):
+    """Fastest of `runs` parses in seconds and the parsed rows"""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        data = parse(html)
+        times.append(time.perf_counter() - started)
+    return min(times), data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vergleicht die Parser für die club300-Vogelliste")
+    parser.add_argument("--file", help="lokale HTML-Datei statt der Website")
+    parser.add_argument("--rows", type=int, default=11000, help="Zeilen der Beispielseite ohne Netz")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            html = f.read()
+    else:
+        try:
+            html = fetch_text(BIRDLIST_URL)
+        except requests.exceptions.RequestException as e:
+            print(f"Website nicht erreichbar ({e}), nutze Beispielseite mit {args.rows} Zeilen")
+            html = sample_page(args.rows)
+
+    fast, data = best_of(parse_birdlist, html, args.runs)
+    slow, expected = best_of(parse_birdlist_soup, html, args.runs)
+    print(f"streaming: {fast * 1000:.0f} ms, BeautifulSoup: {slow * 1000:.0f} ms, {len(data)} Zeilen")
+    if data != expected:
+        raise SystemExit("Parser liefern unterschiedliche Zeilen!")
+    print("Beide Parser liefern identische Zeilen.")
+
+
+if __name__ == "__main__":
+    main()
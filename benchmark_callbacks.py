@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# CALLBACK BENCHMARK
+# =============================================================================
+# Calls update_time_graph (pages/development.py) and update_places_graph
+# (pages/places.py) directly on synthetic datasets (datadupli) of growing size
+# and reports latency percentiles and peak memory per input mix. The figure
+# cache is cleared before every call, so each call does the full work.
+#
+# Save a baseline on the unchanged code, then compare after the change - the
+# script exits with 1 if a case got slower or bigger than allowed, with 2 if
+# there is no baseline to compare with:
+#     python benchmark_callbacks.py --sizes 100000 1000000 --save
+#     python benchmark_callbacks.py --sizes 100000 1000000
+# Baselines only compare on the same machine.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, "benchmark_callbacks.json")
+
+# (page, case, callback arguments) - placeholders are filled per dataset:
+# {names} = the five most ringed species, {place} = the busiest place, {month} = its busiest month
+CASES = [
+    ("time", "all species, month, grouped", ("2000-01-01", "2024-12-31", ["all"], ["all"], "M", "group")),
+    ("time", "all species, year, stacked", ("2000-01-01", "2024-12-31", ["all"], ["all"], "J", "stack")),
+    ("time", "5 species, month, stacked", ("2000-01-01", "2024-12-31", "{names}", ["all"], "M", "stack")),
+    ("time", "5 species, one place, year", ("2000-01-01", "2024-12-31", "{names}", "{place}", "J", "group")),
+    ("time", "zoomed to one month", ("{month_start}", "{month_end}", ["all"], ["all"], "M", "group")),
+    ("places", "all species, grouped", ("2000-01-01", "2024-12-31", ["all"], "group")),
+    ("places", "5 species, stacked", ("2000-01-01", "2024-12-31", "{names}", "stack")),
+    ("places", "zoomed to one month", ("{month_start}", "{month_end}", ["all"], "group")),
+]
+
+
+def synthetic_star(rows, seed=1):
+    """Star schema of `rows` synthetic ringings, species named like prep_birddata() does"""
+    from birddataload import SPECIES_NAME_COLUMNS, species_names
+    from birdstar import build_star
+    from datadupli import DEFAULT_SPECIES, synthetic_ringing_chunks
+
+    # ten chunks, so rings are recaptured within and across chunks - unique counts differ from row counts
+    df = pd.concat(synthetic_ringing_chunks(rows, chunk_rows=max(1, rows // 10), seed=seed), ignore_index=True)
+    print(f"{df['strRingNr'].nunique():,} Ringe in {rows:,} Zeilen")
+    # offline stand-in for the EURING/club300 species dimension
+    species_dim = pd.DataFrame({column: [f"{column} {code}" for code in DEFAULT_SPECIES]
+                                for column in SPECIES_NAME_COLUMNS}, index=list(DEFAULT_SPECIES))
+    return build_star(df, label_builders={'species': lambda codes: species_names(codes, species_dim)})
+
+
+def fill_arguments(args, star):
+    """Replaces the placeholders of a case with values from the dataset"""
+    from birdstar import denormalize
+
+    wide = denormalize(star, labels=('Name', 'strPlaceCode'))
+    month = wide['Fangtag'].dt.to_period('M').value_counts().idxmax()
+    values = {
+        "{names}": wide['Name'].value_counts().index[:5].tolist(),
+        "{place}": [wide['strPlaceCode'].value_counts().index[0]],
+        "{month_start}": str(month.start_time.date()),
+        "{month_end}": str(month.end_time.date()),
+    }
+    return tuple(values.get(arg, arg) if isinstance(arg, str) else arg for arg in args)
+
+
+def measure(callback, args, runs, warmup=2):
+    """Latency per call in ms (figure cache cleared before each) and peak traced memory in MB"""
+    from figurecache import figure_cache
+
+    for _ in range(warmup):
+        figure_cache.clear()
+        callback(*args)
+    times = []
+    for _ in range(runs):
+        figure_cache.clear()
+        started = time.perf_counter()
+        callback(*args)
+        times.append((time.perf_counter() - started) * 1000)
+
+    figure_cache.clear()
+    tracemalloc.start()  # separate call - tracing slows the timed runs down
+    callback(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {"p50_ms": round(p50, 2), "p90_ms": round(p90, 2), "p99_ms": round(p99, 2),
+            "max_ms": round(max(times), 2), "peak_mb": round(peak / 1e6, 2)}
+
+
+def compare(results, baseline, tolerance, memory_tolerance, slack_ms):
+    """Cases slower (p50, p90) or bigger (peak memory) than the baseline allows"""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        for metric in ("p50_ms", "p90_ms"):
+            if result[metric] > old[metric] * (1 + tolerance) + slack_ms:
+                regressions.append(f"{key}: {metric} {old[metric]} -> {result[metric]}")
+        if result["peak_mb"] > old["peak_mb"] * (1 + memory_tolerance) + 0.5:
+            regressions.append(f"{key}: peak_mb {old['peak_mb']} -> {result['peak_mb']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Misst die Latenz der Dashboard-Callbacks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="Zeilen je Datensatz")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save", action="store_true", help="Ergebnis als neue Baseline speichern")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="erlaubte Verlangsamung (0.25 = 25 %%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25)
+    parser.add_argument("--slack-ms", type=float, default=2.0, help="Rauschen, das immer erlaubt ist")
+    parser.add_argument("--cases", help="nur Fälle, deren Name diesen Text enthält")
+    args = parser.parse_args()
+
+    # the pages register their callbacks with the app - importing it is enough, no server starts
+    os.chdir(HERE)
+    sys.path.insert(0, HERE)
+    import dash
+    import app  # noqa: F401
+    from birdcube import RingCube
+    from birddatastore import BirdDataset, install_dataset
+
+    pages = {page['module']: sys.modules[page['module']] for page in dash.page_registry.values()}
+    callbacks = {"time": pages['pages.development'].update_time_graph,
+                 "places": pages['pages.places'].update_places_graph}
+
+    results = {}
+    for version, rows in enumerate(args.sizes, start=1):
+        started = time.perf_counter()
+        star = synthetic_star(rows)
+        install_dataset(BirdDataset(star, RingCube(star), version, None, time.strftime("%Y-%m-%d %H:%M:%S"), 0.0))
+        print(f"\nDatensatz mit {rows:,} Zeilen in {time.perf_counter() - started:.1f} s erzeugt")
+        for page, case, case_args in CASES:
+            if args.cases and args.cases not in case:
+                continue
+            key = f"{page} | {case} | {rows}"
+            results[key] = measure(callbacks[page], fill_arguments(case_args, star), args.runs)
+            r = results[key]
+            print(f"  {page:6} {case:30} p50 {r['p50_ms']:8.1f} ms  p90 {r['p90_ms']:8.1f} ms  "
+                  f"p99 {r['p99_ms']:8.1f} ms  Speicher {r['peak_mb']:7.1f} MB")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline gespeichert: {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        # a comparison run without baseline must not pass as "no regression"
+        print(f"\nKeine Baseline ({args.baseline}) - mit --save anlegen.")
+        raise SystemExit(2)
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.memory_tolerance, args.slack_ms)
+    if regressions:
+        print("\nVerschlechterungen gegenüber der Baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        raise SystemExit(1)
+    print(f"\nKeine Verschlechterung gegenüber {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
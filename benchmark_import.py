@@ -0,0 +1,59 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# =============================================================================
+# IMPORT-TIME BENCHMARK
+# =============================================================================
+# Imports each module in a fresh interpreter (like a new worker) and reports
+# the wall time plus the slowest imports from python -X importtime.
+# Run it before and after a change, e.g.:
+#     python benchmark_import.py birddataload fdpdataload birddatastore --runs 5
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_once(module):
+    """Seconds for `import module` in a new interpreter and the -X importtime lines"""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=HERE, capture_output=True, text=True)
+    seconds = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} fehlgeschlagen:\n{result.stderr[-2000:]}")
+    return seconds, result.stderr.splitlines()
+
+
+def slowest_imports(lines, top):
+    """The `top` modules with the highest own import time (microseconds)"""
+    rows = []
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        rows.append((int(own), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Misst die Importzeit der App-Module")
+    parser.add_argument("modules", nargs="*", default=["birddataload", "birddatastore", "app"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        import_once(module)  # warm the disk cache and __pycache__ first
+        runs = [import_once(module) for _ in range(args.runs)]
+        times = [seconds for seconds, _ in runs]
+        print(f"{module}: median {statistics.median(times) * 1000:.0f} ms "
+              f"(min {min(times) * 1000:.0f} ms, {args.runs} Läufe)")
+        for own, name in slowest_imports(runs[-1][1], args.top):
+            print(f"    {own / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
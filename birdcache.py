@@ -0,0 +1,33 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows - a single dev server needs no lock between processes
+    fcntl = None
+
+# =============================================================================
+# LOCAL CACHE DIRECTORY
+# =============================================================================
+# Snapshots and downloaded source data are kept here between restarts.
+
+CACHE_DIR = os.getenv("BIRD_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+
+
+def cache_path(*parts):
+    """Returns a path inside the cache directory and creates its parent folder"""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+
+@contextmanager
+def process_lock(name):
+    """Exclusive lock across processes (e.g. gunicorn workers) on a file in the cache directory"""
+    if fcntl is None:
+        yield
+        return
+    with open(cache_path("locks", name + ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)  # released when the file is closed
+        yield
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+from birddataload import date_bounds
+from birdstar import keys_for, label_codes, labels_in_use
+
+# =============================================================================
+# PRE-AGGREGATED RING COUNTS
+# =============================================================================
+# Unique ring counts are not additive, so the cube keeps the distinct ring keys
+# of every (month, place, species) cell instead of a number. A selection is
+# answered by merging the ids of its cells. Only the partly selected months at
+# the edges of a date range are taken from the single rows, found by binary
+# search in the date-sorted frame.
+
+ONE_NS = pd.Timedelta(1, 'ns')
+
+
+def month_index(fangtag):
+    """Months since year 0 - one integer per calendar month"""
+    return fangtag.dt.year.astype('int32') * 12 + fangtag.dt.month.astype('int32') - 1
+
+
+def month_of(timestamp):
+    return timestamp.year * 12 + timestamp.month - 1
+
+
+def month_start(month):
+    return pd.Timestamp(year=int(month) // 12, month=int(month) % 12 + 1, day=1)
+
+
+class RingCube:
+    """Distinct ring keys per (month, place, species) cell of the star schema.
+
+    Expects the fact table sorted by Fangtag (see build_star) and keeps a
+    reference to it for the edge months instead of a copy. Cells hold surrogate
+    keys only - labels are looked up for the result rows of a query.
+    """
+
+    def __init__(self, star):
+        self.star = star
+        self.fact = star.fact
+
+        # one row per distinct ring in a cell, sorted by month for range slicing
+        cells = self.rows(0, len(self.fact))
+        self.cells = cells.drop_duplicates().sort_values('month', kind='stable').reset_index(drop=True)
+
+        # label code per surrogate key - species with the same name count as one bird type
+        self.codes = {label: label_codes(star, label) for label in ('Name', 'strPlaceCode')}
+        self.size = len(self.fact)
+
+    def rows(self, lo, hi):
+        """Cell columns for the single rows lo:hi of the fact table"""
+        part = self.fact.iloc[lo:hi]
+        rows = pd.DataFrame({
+            'month': month_index(part['Fangtag']),
+            'place_key': part['place_key'],
+            'species_key': part['species_key'],
+            'ring': part['ring_key'],
+        })
+        return rows[rows['ring'] >= 0]  # no ring number - never counted by nunique()
+
+    def select(self, start=None, end=None):
+        """Returns cells and single rows that together cover Fangtag in [start, end]"""
+        lo, hi = date_bounds(self.fact, start, end)
+
+        # months lying completely inside the range come from the cells
+        first_full = None if start is None else month_of(start - ONE_NS) + 1
+        last_full = None if end is None else month_of(end + ONE_NS) - 1
+        if first_full is not None and last_full is not None and first_full > last_full:
+            return self.cells.iloc[0:0], self.rows(lo, hi)
+
+        fangtag = self.fact['Fangtag']
+        months = self.cells['month']
+        a = lo if first_full is None else fangtag.searchsorted(month_start(first_full), side='left')
+        b = hi if last_full is None else fangtag.searchsorted(month_start(last_full + 1), side='left')
+        c_lo = 0 if first_full is None else months.searchsorted(first_full, side='left')
+        c_hi = len(months) if last_full is None else months.searchsorted(last_full, side='right')
+        edges = pd.concat([self.rows(lo, a), self.rows(b, hi)])
+        return self.cells.iloc[c_lo:c_hi], edges
+
+    def parts(self, start=None, end=None, names=None, places=None, freq='M'):
+        """Cells and edge rows of a selection, with a 'period' column (month or year number)"""
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        cells, edges = self.select(start, end)
+        parts = pd.concat([cells, edges], ignore_index=True)
+
+        if names is not None:
+            parts = parts[parts['species_key'].isin(keys_for(self.star, 'Name', names))]
+        if places is not None:
+            parts = parts[parts['place_key'].isin(keys_for(self.star, 'strPlaceCode', places))]
+
+        # label codes instead of labels, -1 = no label
+        columns = {'period': parts['month'] if freq == 'M' else parts['month'] // 12}
+        for label, key in (('Name', 'species_key'), ('strPlaceCode', 'place_key')):
+            keys = parts[key].to_numpy()
+            columns[label] = np.where(keys >= 0, self.codes[label][0][keys], -1)
+        return parts.assign(**columns)
+
+    @staticmethod
+    def labelled(parts, columns):
+        """Drops rows without label in one of `columns` - like groupby() drops NaN keys"""
+        columns = [column for column in columns if column != 'period']
+        return parts[(parts[columns] >= 0).all(axis=1)] if columns else parts
+
+    def resolve(self, label, codes):
+        """Labels for label codes - only called for the rows of a result"""
+        return pd.Categorical.from_codes(codes, categories=self.codes[label][1])
+
+    def count_rings(self, by, start=None, end=None, names=None, places=None, freq='M'):
+        """Unique rings grouped by `by` (subset of 'period', 'strPlaceCode', 'Name').
+
+        Same result as filtering the rows and running groupby(by)['strRingNr'].nunique().
+        'period' is the month start (freq='M') or the year as string (freq='Y').
+        """
+        parts = self.labelled(self.parts(start, end, names, places, freq), by)
+        counts = parts.groupby(by)['ring'].nunique().reset_index(name='UniqueBirdCount')
+        for column in by:
+            if column == 'period':
+                counts['period'] = period_labels(counts['period'], freq)
+            else:
+                counts[column] = self.resolve(column, counts[column].to_numpy())
+        return counts
+
+    def labels(self, label):
+        """Distinct labels in order of their first ringing - the dropdown options"""
+        return labels_in_use(self.star, label)
+
+def period_labels(periods, freq):
+    """Month numbers to month start dates (freq='M'), year numbers to strings (freq='Y')"""
+    periods = periods.reset_index(drop=True)
+    if freq == 'M':
+        values = periods.to_numpy()
+        return pd.to_datetime(pd.DataFrame({'year': values // 12, 'month': values % 12 + 1, 'day': 1}))
+    return periods.astype(str)
@@ -1,11 +1,39 @@
 import pandas as pd
 import requests
+from functools import wraps
 from io import StringIO
-from bs4 import BeautifulSoup
 import traceback
-import requests
 import re
+import time
 from fdpdataload import get_ftp_data
+from birdhttp import HTTP_MAX_AGE, fetch_text
+from birdhtml import table_rows
+from birdprofile import stage
+from birdstar import MISSING_LABELS, build_star, denormalize
+
+# Importing this module loads nothing - the reference tables (EURING codes,
+# club300 names) are downloaded on first use and kept in memory for
+# HTTP_MAX_AGE, so a dataset refresh after that picks up new codes and names.
+# The pages themselves are cached on disk by birdhttp.
+
+def keep_result(loader):
+    """Keeps the last successful (not None) result of a reference loader in memory for HTTP_MAX_AGE seconds.
+
+    After that the next call loads again - birdhttp revalidates the pages, unchanged ones come from its disk cache.
+    """
+    result = {}
+
+    @wraps(loader)
+    def cached():
+        if 'value' not in result or time.monotonic() - result['loaded'] > HTTP_MAX_AGE:
+            value = loader()
+            if value is None:  # failed loads are retried on the next call, meanwhile the old result is used
+                return result.get('value')
+            result['value'], result['loaded'] = value, time.monotonic()
+        return result['value']
+
+    cached.cache_clear = result.clear
+    return cached
 
 def get_first_value(df):
     columns = list(df.columns)
@@ -20,46 +48,56 @@ def load_csv_likabrow(url):
     }
 
     try:
-        response = requests.get(url, headers=headers)
-        response. raise_for_status()
-    except requests.exceptions.HTTPError as err: #is not working
+        text = fetch_text(url, headers=headers)
+    except requests.exceptions.RequestException as err:
         print("Issue with euring website: ", err)
+        print(f'Failed to retrieve data: {url}')
+        return None
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        species_data = StringIO(response.text)
-        species_df = pd.read_csv(species_data)
-        return species_df
-    else:
-        print(f'Failed to retrieve data: {response.status_code}')
+    species_data = StringIO(text)
+    species_df = pd.read_csv(species_data)
+    return species_df
+
+# bird names from the club300 table (german, english, latin names) - one list per row
+def parse_birdlist(html):
+    """Streaming extraction (birdhtml) - reads only the cell texts, builds no document tree"""
+    return [cells[2:5] for children, cells in table_rows(html)[3:] if children >= 5]
+
+def parse_birdlist_soup(html):
+    """Same rows with BeautifulSoup - the fallback if the streaming parser fails"""
+    from bs4 import BeautifulSoup  # only needed for the fallback
+    soup = BeautifulSoup(html, 'html.parser')
+   # if debug:
+  #      'Websites html structure:'
+   #     print(soup.prettify())
+
+    # find the bird data columns and get rows to lists then to data frame
+    rows = soup.find_all('tr')
+
+    data = []
+    for row in rows[3:]:
+        if len(row) >= 5:
+            fields = row.find_all("td")
+            ger = fields[2].get_text()
+            eng = fields[3].get_text()
+            lat = fields[4].get_text()
+            data.append([ger, eng, lat])
+    return data
 
-# use BeautifulSoup to bird name data from website (german, english, latin names)
 def load_birddatatodf(url, debug=False):
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-       # if debug:
-      #      'Websites html structure:'
-       #     print(soup.prettify())
-
-        # find the bird data columns and get rows to lists then to data frame
-        rows = soup.find_all('tr')
+        html = fetch_text(url)
+        try:
+            data = parse_birdlist(html)
+        except Exception as e:
+            print(f'Streaming parser failed ({e}), using BeautifulSoup')
+            data = parse_birdlist_soup(html)
 
-        data = []
-        for row in rows[3:]:
-            if len(row) >= 5:
-                fields = row.find_all("td")
-                ger = fields[2].get_text()
-                eng = fields[3].get_text()
-                lat = fields[4].get_text()
-                data.append([ger, eng, lat])
         columns = ["Deutscher Name", "Englischer Name", "Lateinischer Name"]
         d = pd.DataFrame(data, columns=columns)
         if debug:
             print('Website data',d.head())
-        return pd.DataFrame(data, columns=columns)
-
+        return d
 
     # handle load issues
     except Exception as e:
@@ -68,10 +106,9 @@ def load_birddatatodf(url, debug=False):
         return None
 
 def laod_ger_birds(url):
+    from bs4 import BeautifulSoup
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = BeautifulSoup(fetch_text(url), 'html.parser')
         ol_elements = soup.find_all("ol", {"start": "0"})
         li_elements = ol_elements[0].find_all("li")
         data = []
@@ -92,16 +129,21 @@ def laod_ger_birds(url):
         print(f'Issue with data load from {url}: {e}')
         return None
 
-bla = laod_ger_birds('https://www.club300.de/ranking/birdlist_de.php')
+@keep_result
+def get_ger_birds():
+    """German club300 ranking list - loaded on first call, not on import"""
+    return laod_ger_birds('https://www.club300.de/ranking/birdlist_de.php')
 
 
 def get_latest_euring_species_code_url():
+    from bs4 import BeautifulSoup
     url = 'https://euring.org/data-and-codes/euring-codes'  # Anpassen, falls nötig
     try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-    except requests.exceptions.HTTPError as err:
-        raise SystemExit(err)
+        soup = BeautifulSoup(fetch_text(url), 'html.parser')
+    except requests.exceptions.RequestException as err:
+        # None like the other reference loaders - SystemExit would end the refresher thread
+        print(f"Issue with euring website: {err}")
+        return None
 
     # Begrenze die Suche auf den "Current Codes"-Block
     current_codes_block = soup.select_one('#block-views-current-codes-block')
@@ -121,9 +163,16 @@ def get_latest_euring_species_code_url():
 
     return None  # Falls kein Treffer gefunden wurde
 
+@keep_result
 def get_bird_code ():
-    euring_species_url = get_latest_euring_species_code_url()
-    df_birdid = load_csv_likabrow(euring_species_url)
+    with stage("euring") as s:
+        euring_species_url = get_latest_euring_species_code_url()
+        if euring_species_url is None:
+            return None
+        df_birdid = load_csv_likabrow(euring_species_url)
+        if df_birdid is None:
+            return None
+        s.set(rows_out=len(df_birdid))
 
     df_birdid.name = "birdid df"
     print(df_birdid.name)
@@ -132,17 +181,23 @@ def get_bird_code ():
     return df_birdid
 
 def get_ringing_data ():
-    fact_dfs, dim_dfs = get_ftp_data()
-    df_ringing = fact_dfs["df_ringing"]
+    with stage("ringing_data") as s:
+        fact_dfs, dim_dfs = get_ftp_data()
+        df_ringing = fact_dfs["df_ringing"]
+        s.set(rows_out=len(df_ringing))
 
     df_ringing.name = "ringing df"
     print(df_ringing.name)
     get_first_value(df_ringing)
 
-    return df_ringing
+    # the lookup tables become the dimensions of the star schema (birdstar)
+    return df_ringing, dim_dfs
 
+@keep_result
 def get_bird_translations():
-    df_birdnames = load_birddatatodf('https://www.club300.de/publications/wp-bird-list.php', debug=False)
+    with stage("club300") as s:
+        df_birdnames = load_birddatatodf('https://www.club300.de/publications/wp-bird-list.php', debug=False)
+        s.set(rows_out=0 if df_birdnames is None else len(df_birdnames))
 
     if df_birdnames is not None:
         print("Bird names loaded")
@@ -152,50 +207,96 @@ def get_bird_translations():
 
     return df_birdnames
 
-def prep_birddata():
-
-    # Load further bird data to display names
+def date_bounds(df, start_date=None, end_date=None):
+    """Row positions [lo, hi) of start_date <= Fangtag <= end_date in a frame sorted by Fangtag"""
+    fangtag = df['Fangtag']
+    lo = 0 if start_date is None else fangtag.searchsorted(pd.Timestamp(start_date), side='left')
+    hi = len(fangtag) if end_date is None else fangtag.searchsorted(pd.Timestamp(end_date), side='right')
+    return lo, max(lo, hi)
+
+# =============================================================================
+# SPECIES DIMENSION
+# =============================================================================
+# One row per EURING species code with its display names, built from the two
+# reference tables instead of merging them into every ringing row. The species
+# dimension of the star schema gets its names from here, once per code.
+
+SPECIES_NAME_COLUMNS = ['Name', 'NameGER', 'NameENG', 'NameLAT']
+
+@keep_result
+def get_species_dim():
+    """Names per EURING code (index), from the EURING codes and the club300 translations"""
     df_birdid = get_bird_code()
-
-    # Load data to analyze
-    df = get_ringing_data()
-    # Merge species ID with the original dataframe to add species names
-    # TBD
-
-    # Ensure DateTimeID is in the correct datetime format, and remove rows with invalid dates
-    df['Fangtag'] = pd.to_datetime(df['Fangtag'], errors='coerce')
-
-    # Drop rows where DateTimeID could not be parsed
-    df = df.dropna(subset=['Fangtag'])
-
-    df_merg = pd.merge(df, df_birdid, how='left', left_on=['strSpecies'], right_on=['EURING_Code'])
-    df_merg.name = "merged df"
-    print(df_merg.name)
-    get_first_value(df_merg)
-
-    # Load name translations --- from club500 URL, ask about usage before data publication!!!!
     df_birdnames = get_bird_translations()
+    if df_birdid is None or df_birdnames is None:
+        # an Exception, not SystemExit - the refresher keeps serving the old dataset and retries
+        raise RuntimeError("Referenzdaten (EURING-Codes oder club300-Namen) nicht verfügbar")
     df_birdnames.name = "bridname df"
     print(df_birdnames.name)
     get_first_value(df_birdnames)
 
+    # one row per code and per latin name - a duplicate would otherwise multiply ringing rows
+    codes = df_birdid.drop_duplicates('EURING_Code').set_index('EURING_Code')
+    names = (df_birdnames.assign(**{'Lateinischer Name': df_birdnames['Lateinischer Name'].str.strip()})
+             .drop_duplicates('Lateinischer Name').set_index('Lateinischer Name'))
+
     #trim join columns
-    df_merg['Current_Name'] = df_merg['Current_Name'].str.strip()
-    df_birdnames['Lateinischer Name'] = df_birdnames['Lateinischer Name'].str.strip()
+    latin = codes['Current_Name'].str.strip()
+    dim = pd.DataFrame({
+        'NameGER': latin.map(names['Deutscher Name']),
+        'NameENG': latin.map(names['Englischer Name']),
+        'NameLAT': latin.where(latin.isin(names.index)),
+    }, index=codes.index)
+    dim['Name'] = dim['NameGER'].combine_first(dim['NameENG']).combine_first(dim['NameLAT'])
+    print(f"Artendimension: {len(dim)} EURING-Codes, {dim['Name'].notna().sum()} mit Namen")
+    return dim[SPECIES_NAME_COLUMNS]
+
+def species_names(species, dim):
+    """Name columns for the species codes `species` (the species dimension - no missing codes).
+
+    Ringings without strSpecies have no dimension row, their labels come from birdstar.MISSING_LABELS.
+    """
+    species = species.astype('category')
+    codes = species.cat.codes.to_numpy()
+    known = dim.reindex(species.cat.categories)
+
+    # species without EURING entry or name are shown by their code
+    known['Name'] = known['Name'].combine_first(pd.Series(species.cat.categories.astype(str), index=known.index))
+    table = known.reset_index(drop=True)
+    table['NameLAT'] = table['NameLAT'].fillna(MISSING_LABELS['NameLAT'])
+
+    columns = {}
+    for column in SPECIES_NAME_COLUMNS:
+        values = table[column].astype('category')
+        columns[column] = (pd.Categorical.from_codes(values.cat.codes.to_numpy()[codes], dtype=values.dtype)
+                           .remove_unused_categories())
+    return pd.DataFrame(columns, index=species.index)
+
+def prep_birddata():
+    """Ringing data as star schema: narrow fact table plus species, place and ring dimensions"""
 
-    df_with_names = pd.merge(df_merg, df_birdnames, how='left', left_on=['Current_Name'], right_on=['Lateinischer Name'])
-    df_with_names = df_with_names.rename(columns={"Deutscher Name": "NameGER", "Lateinischer Name": "NameLAT", "Englischer Name": "NameENG"})
-    df_with_names['Name'] = (
-        df_with_names['NameGER'].combine_first(df_with_names['NameENG'])
-        .combine_first(df_with_names['NameLAT']).combine_first(df_with_names['strSpecies']))
+    # Species names - small, built once and kept in memory
+    with stage("species_dim") as s:
+        species_dim = get_species_dim()
+        s.set(rows_out=len(species_dim))
+
+    # Load data to analyze
+    df, dim_dfs = get_ringing_data()
 
-    values = {"NameLAT": "Latin Name missing"}
-    df_with_names = df_with_names.fillna(value=values)
+    with stage("to_datetime") as s:
+        s.set(rows_in=len(df))
+        # Ensure DateTimeID is in the correct datetime format, and remove rows with invalid dates
+        df['Fangtag'] = pd.to_datetime(df['Fangtag'], errors='coerce')
 
-    df_with_names.name = "merged with names df"
-    print(df_with_names.name)
-    get_first_value(df_with_names)
-    df = df_with_names
+        # Drop rows where DateTimeID could not be parsed
+        df = df.dropna(subset=['Fangtag'])
+        s.set(rows_out=len(df))
 
-    return df
+    # Names are resolved once per species code, not per ringing row
+    with stage("build_star") as s:
+        s.set(rows_in=len(df))
+        star = build_star(df, dim_dfs, label_builders={'species': lambda codes: species_names(codes, species_dim)})
+        s.set(rows_out=len(star.fact), dimensions={name: len(dim) for name, dim in star.dims.items()})
 
+    get_first_value(denormalize(star, rows=[0]))
+    return star
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+from birdcube import RingCube
+from birddataload import prep_birddata
+from birdprofile import finish_report, stage, start_report
+from birdsnapshot import load_or_build, try_source_fingerprint
+from birdsql import QUERY_BACKEND, open_sql_cube
+from figurecache import figure_cache
+
+# =============================================================================
+# SHARED DATASET REGISTRY
+# =============================================================================
+# prep_birddata() downloads the FTP workbooks and scrapes EURING and club300,
+# so it must not run once per page. All pages get the same tables from here,
+# loaded from the local snapshot whenever the FTP workbooks are unchanged.
+#
+# A background thread rebuilds the dataset when the FTP workbooks change and
+# swaps the new one in with a single assignment. Callbacks take one dataset at
+# their start (get_dataset()) and work on it, so a swap never mixes versions.
+
+# Everything a callback needs from one build - never modified after creation
+BirdDataset = namedtuple('BirdDataset', ['star', 'cube', 'version', 'fingerprint', 'built_at', 'build_seconds'])
+
+REFRESH_INTERVAL = int(os.getenv("BIRD_REFRESH_INTERVAL", "3600"))  # seconds, 0 = no scheduled refresh
+
+_build_lock = threading.Lock()  # one build at a time - readers never wait for it
+_refresh_requested = threading.Event()
+_refresher = None
+_dataset = None
+
+
+def build_dataset(fingerprint, version):
+    """Loads or builds the star schema and its cube - or opens the shared SQL database instead"""
+    start_report(f"build v{version}")  # get_dataset() already started it for the first build
+    started = time.monotonic()
+    try:
+        if QUERY_BACKEND == "sql":
+            star = None  # the ringing data lives in the database file only, not in every worker
+            cube = open_sql_cube(lambda: load_or_build(prep_birddata, fingerprint), fingerprint)
+        else:
+            star = load_or_build(prep_birddata, fingerprint)
+            with stage("cube") as s:
+                cube = RingCube(star)
+                s.set(rows_in=cube.size, cells=len(cube.cells))
+    finally:
+        build_seconds = time.monotonic() - started
+        finish_report(version=version, fingerprint=fingerprint, backend=QUERY_BACKEND)
+    print(f"Datensatz v{version} bereit: {cube.size} Zeilen in {build_seconds:.1f} s.")
+    return BirdDataset(star, cube, version, fingerprint, time.strftime("%Y-%m-%d %H:%M:%S"), build_seconds)
+
+
+def install_dataset(dataset):
+    """Makes `dataset` the current one - a single reference assignment, so the swap is atomic"""
+    global _dataset
+    _dataset = dataset
+    figure_cache.clear()  # figures of an older dataset are useless now
+    return dataset
+
+
+def refresh_dataset():
+    """Rebuilds the dataset if the FTP workbooks changed and swaps it in. Returns the current dataset.
+
+    Requests keep being served from the old dataset while this runs.
+    """
+    with _build_lock:
+        current = _dataset
+        fingerprint = try_source_fingerprint()
+        if current is not None and (fingerprint is None or fingerprint == current.fingerprint):
+            return current  # nothing new - or the FTP server is not reachable
+        return install_dataset(build_dataset(fingerprint, 1 if current is None else current.version + 1))
+
+
+def get_dataset():
+    """Returns the current dataset, building the first one if needed.
+
+    Concurrent first calls wait for the same build instead of starting their own.
+    The tables are shared by all pages and callbacks - treat them as read-only.
+    """
+    dataset = _dataset
+    if dataset is None:
+        with _build_lock:
+            dataset = _dataset  # another thread may have built it while we waited
+            if dataset is None:
+                start_report("startup")  # includes the FTP listing for the fingerprint
+                dataset = install_dataset(build_dataset(try_source_fingerprint(), 1))
+    return dataset
+
+
+def get_birdstar():
+    """Returns the ringing star schema (fact table and dimensions) of the current dataset.
+
+    None with BIRD_QUERY_BACKEND=sql - use the cube for queries.
+    """
+    return get_dataset().star
+
+
+def get_birdcube():
+    """Returns the query backend of the current dataset - RingCube, or SqlCube with BIRD_QUERY_BACKEND=sql"""
+    return get_dataset().cube
+
+
+def get_dataset_version():
+    """Version of the current dataset - part of every figure cache key, 0 before the first build"""
+    dataset = _dataset
+    return 0 if dataset is None else dataset.version
+
+
+def dataset_info():
+    """Version, build time and build duration of the current dataset"""
+    dataset = _dataset
+    if dataset is None:
+        return {"version": 0}
+    return {"version": dataset.version, "built_at": dataset.built_at,
+            "build_seconds": round(dataset.build_seconds, 3), "rows": dataset.cube.size, "backend": type(dataset.cube).__name__}
+
+
+def request_refresh():
+    """Asks the background refresher to check the FTP workbooks now instead of at the next interval"""
+    _refresh_requested.set()
+
+
+def start_refresher(interval=REFRESH_INTERVAL):
+    """Starts the daemon thread that refreshes the dataset every `interval` seconds or on request"""
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return _refresher
+
+    def run():
+        while True:
+            _refresh_requested.wait(timeout=interval or None)
+            _refresh_requested.clear()
+            try:
+                refresh_dataset()
+            except Exception as e:  # keep serving the old dataset
+                print(f"Aktualisierung fehlgeschlagen: {e}")
+
+    _refresher = threading.Thread(target=run, name="birddata-refresher", daemon=True)
+    _refresher.start()
+    return _refresher
@@ -0,0 +1,104 @@
+from html.parser import HTMLParser
+
+# =============================================================================
+# STREAMING TABLE EXTRACTION
+# =============================================================================
+# The club300 bird list is one large table. Building a BeautifulSoup tree for
+# it only to read three cells per row is slow, so this parser reads the page
+# in one pass and keeps nothing but the cell texts per <tr>. It follows the
+# rules of BeautifulSoup's html.parser builder (no implicit closing of
+# <td>/<tr>, end tags close everything opened after their start tag), so both
+# give the same rows - see benchmark_birdlist.py.
+
+# Elements without end tag - never put on the stack of open elements
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+                 "meta", "param", "source", "track", "wbr"}
+# Text inside these elements is not returned by get_text()
+SKIPPED_TEXT_ELEMENTS = {"script", "style", "template"}
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+class TableRowParser(HTMLParser):
+    """Collects per <tr>: the number of direct children and the texts of all <td> inside it"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []  # [children, cells, depth of its children] - like find_all('tr')
+        self.open = []  # names of the open elements
+        self.open_rows = []  # rows whose <tr> is still open
+        self.open_cells = []  # text chunks of the <td> still open
+        self.text = []  # text since the last tag, joined into one string like BeautifulSoup does
+
+    def flush_text(self):
+        """Ends the current text run - whitespace-only runs shrink to one space or newline"""
+        if not self.text:
+            return
+        text = "".join(self.text)
+        self.text = []
+        if not text.strip(ASCII_SPACES) and "pre" not in self.open and "textarea" not in self.open:
+            text = "\n" if "\n" in text else " "
+        self.add_child()
+        if not (self.open and self.open[-1] in SKIPPED_TEXT_ELEMENTS):
+            for cell in self.open_cells:
+                cell.append(text)  # get_text() of a cell includes the text of nested cells
+
+    def add_child(self):
+        """Counts a new direct child for the open rows it belongs to"""
+        for row in self.open_rows:
+            if row[2] == len(self.open):
+                row[0] += 1
+
+    def handle_starttag(self, tag, attrs):
+        self.flush_text()
+        self.add_child()
+        if tag in VOID_ELEMENTS:
+            return
+        self.open.append(tag)
+        if tag == "tr":
+            row = [0, [], len(self.open)]  # children, cells, depth of its children
+            self.rows.append(row)
+            self.open_rows.append(row)
+        elif tag == "td":
+            cell = []
+            for row in self.open_rows:
+                row[1].append(cell)  # find_all('td') also finds the cells of nested rows
+            self.open_cells.append(cell)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self.flush_text()
+        if tag not in self.open:
+            return  # stray end tag - ignored like BeautifulSoup does
+        while self.open:
+            closed = self.open.pop()
+            if closed == "tr":
+                self.open_rows.pop()
+            elif closed == "td":
+                self.open_cells.pop()
+            if closed == tag:
+                break
+
+    def handle_data(self, data):
+        self.text.append(data)
+
+    def handle_comment(self, data):
+        self.flush_text()
+        self.add_child()  # a child for len(row), but no text for get_text()
+
+    handle_decl = handle_pi = handle_comment
+
+    def close(self):
+        super().close()
+        self.flush_text()
+
+
+def table_rows(html):
+    """Returns (children, cell texts) for every <tr> of the page, in document order"""
+    parser = TableRowParser()
+    parser.feed(html)
+    parser.close()
+    return [(row[0], ["".join(cell) for cell in row[1]]) for row in parser.rows]
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from birdcache import cache_path
+from birdprofile import stage
+
+# =============================================================================
+# SHARED HTTP CLIENT FOR THE REFERENCE DATA
+# =============================================================================
+# The EURING codes and the club300 bird lists change a few times a year, so the
+# pages are kept on disk with their ETag/Last-Modified headers. A copy younger
+# than HTTP_MAX_AGE is used without asking the server, an older one is
+# revalidated with a conditional GET (304 = keep the copy). If the website is
+# down - or BIRD_OFFLINE=1 is set - the last good copy is served instead.
+
+HTTP_TIMEOUT = (float(os.getenv("BIRD_HTTP_CONNECT_TIMEOUT", "5")),  # seconds to connect
+                float(os.getenv("BIRD_HTTP_READ_TIMEOUT", "20")))  # seconds between bytes
+HTTP_MAX_AGE = int(os.getenv("BIRD_HTTP_MAX_AGE", str(24 * 3600)))  # seconds, 0 = always revalidate
+OFFLINE = os.getenv("BIRD_OFFLINE", "0").lower() in ("1", "true", "yes")
+
+
+def create_session():
+    """One pooled session - keeps the TLS connections to euring.org and club300.de open"""
+    session = requests.Session()
+    retries = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+session = create_session()
+
+
+def cache_files(url):
+    """Body and header file of the cached copy of `url`"""
+    name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return cache_path("http", name + ".body"), cache_path("http", name + ".json")
+
+
+def read_cached(url):
+    """Returns (text, meta) of the cached copy or (None, None)"""
+    body_file, meta_file = cache_files(url)
+    try:
+        with open(meta_file, encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(body_file, encoding="utf-8") as f:
+            return f.read(), meta
+    except (OSError, ValueError):
+        return None, None
+
+
+def write_cached(url, text, meta):
+    """Stores the copy atomically - the body first, the headers only once the body is complete"""
+    body_file, meta_file = cache_files(url)
+    for path, write in ((body_file, lambda f: f.write(text)), (meta_file, lambda f: json.dump(meta, f))):
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            write(f)
+        os.replace(path + ".tmp", path)
+
+
+def fetch_text(url, headers=None, max_age=HTTP_MAX_AGE, offline=OFFLINE):
+    """Returns the text of `url`, served from the disk cache whenever possible.
+
+    Raises requests.exceptions.RequestException only if the page can neither be
+    downloaded nor taken from the cache.
+    """
+    with stage(f"http {url}") as s:
+        text, source = _fetch_text(url, headers, max_age, offline)
+        s.set(source=source, bytes=len(text.encode("utf-8")))
+    return text
+
+
+def _fetch_text(url, headers, max_age, offline):
+    """(text, where it came from: cache, not modified, stale cache or download)"""
+    text, meta = read_cached(url)
+    if text is not None and (offline or time.time() - meta["fetched_at"] < max_age):
+        return text, "cache"
+    if offline:
+        raise requests.exceptions.ConnectionError(f"Offline und keine Kopie im Cache: {url}")
+
+    # conditional GET - the server answers 304 without a body if the copy is current
+    request_headers = dict(headers or {})
+    if text is not None:
+        if meta.get("etag"):
+            request_headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            request_headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        response = session.get(url, headers=request_headers, timeout=HTTP_TIMEOUT)
+        if response.status_code == 304 and text is not None:
+            meta["fetched_at"] = time.time()
+            write_cached(url, text, meta)
+            return text, "not modified"
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        if text is None:
+            raise
+        print(f"{url} nicht erreichbar ({e}), nutze Kopie vom {time.strftime('%Y-%m-%d %H:%M', time.localtime(meta['fetched_at']))}")
+        return text, "stale cache"
+
+    meta = {"url": url, "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"), "fetched_at": time.time()}
+    write_cached(url, response.text, meta)
+    return response.text, "download"
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+# =============================================================================
+# CALLBACK METRICS
+# =============================================================================
+# Every Dash callback arrives as a POST on /_dash-update-component. Flask
+# hooks around that route time each call and measure the request (inputs)
+# and the response (returned figures), labelled with the callback's function
+# name. /metrics publishes them in the Prometheus text format, together with
+# the figure cache and dataset state.
+#
+# The numbers are per process - with several gunicorn workers every scrape
+# sees the worker that answered it, so rate() and histogram_quantile() over
+# a few scrapes average over all of them. Set BIRD_METRICS_TOKEN to require
+# "Authorization: Bearer <token>" on /metrics.
+
+METRICS_TOKEN = os.getenv("BIRD_METRICS_TOKEN")
+CALLBACK_ROUTE = "/_dash-update-component"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+SIZE_BUCKETS = (1e2, 1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7)  # bytes
+
+
+class Histogram:
+    """Cumulative Prometheus histogram per label value"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # label value -> [count per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            series = self._series.setdefault(label, [[0] * (len(self.buckets) + 1), 0.0])
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self, label_name):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {label: ([*counts], total) for label, (counts, total) in self._series.items()}
+        for label, (counts, total) in sorted(series.items()):
+            labels = f'{label_name}="{escape(label)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter per (label, value) pair"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            text = ",".join(f'{name}="{escape(str(label))}"' for name, label in zip(label_names, labels))
+            lines.append(f"{self.name}{{{text}}} {value}")
+        return lines
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+callback_seconds = Histogram("bird_callback_duration_seconds", "Time to answer a Dash callback", LATENCY_BUCKETS)
+request_bytes = Histogram("bird_callback_request_bytes", "Size of the callback inputs sent by the browser", SIZE_BUCKETS)
+response_bytes = Histogram("bird_callback_response_bytes", "Size of the callback result, e.g. the figure", SIZE_BUCKETS)
+callback_responses = Counter("bird_callback_responses_total", "Callback responses by HTTP status")
+callback_errors = Counter("bird_callback_errors_total", "Callbacks that raised an exception (HTTP 5xx)")
+
+
+UNKNOWN_CALLBACK = "unknown"  # one label for made-up outputs, they must not add series
+
+
+def callback_name(app, output):
+    """Function name of the callback writing `output`, the registered output for clientside ones"""
+    entry = app.callback_map.get(output)
+    if entry is None:
+        return UNKNOWN_CALLBACK
+    return getattr(entry.get("callback"), "__name__", None) or output
+
+
+def extra_metrics():
+    """Gauges of the figure cache, the dataset and the sessions"""
+    from birddatastore import dataset_info  # imported on use - the app imports this module first
+    from birdsession import session_count
+    from figurecache import figure_cache
+
+    info = dataset_info()
+    gauges = [
+        ("bird_figure_cache_hits_total", "counter", "Figure cache hits", figure_cache.hits),
+        ("bird_figure_cache_misses_total", "counter", "Figure cache misses", figure_cache.misses),
+        ("bird_figure_cache_bytes", "gauge", "JSON size of the cached figures", figure_cache.bytes),
+        ("bird_dataset_version", "gauge", "Version of the dataset in use, 0 before the first build", info["version"]),
+        ("bird_dataset_rows", "gauge", "Ringing rows of the dataset in use", info.get("rows", 0)),
+        ("bird_dataset_build_seconds", "gauge", "Duration of the last dataset build", info.get("build_seconds", 0)),
+        ("bird_sessions", "gauge", "Logged in sessions of all workers", session_count()),
+    ]
+    lines = []
+    for name, kind, help_text, value in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return lines
+
+
+def install_metrics(app):
+    """Adds the timing hooks and the /metrics route to the Flask server of the Dash `app`.
+
+    Call it right after creating the app, so the hooks run before the login check.
+    """
+    server = app.server
+
+    @server.before_request
+    def start_callback_timer():
+        if request.path.endswith(CALLBACK_ROUTE):
+            g.callback_started = time.perf_counter()
+
+    @server.after_request
+    def record_callback(response):
+        started = g.pop("callback_started", None)
+        if started is None:
+            return response
+        body = request.get_json(silent=True) or {}
+        name = callback_name(app, str(body.get("output", "")))
+        callback_seconds.observe(name, time.perf_counter() - started)
+        request_bytes.observe(name, request.content_length or 0)
+        if not response.direct_passthrough:
+            response_bytes.observe(name, response.calculate_content_length() or 0)
+        callback_responses.inc((name, response.status_code))
+        if response.status_code >= 500:
+            callback_errors.inc((name,))
+        return response
+
+    @server.route("/metrics")
+    def metrics():
+        if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+            return Response("forbidden\n", status=403, mimetype="text/plain")
+        lines = (callback_seconds.render("callback") + request_bytes.render("callback")
+                 + response_bytes.render("callback") + callback_responses.render(("callback", "status"))
+                 + callback_errors.render(("callback",)) + extra_metrics())
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
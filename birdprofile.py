@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from birdcache import cache_path
+
+# =============================================================================
+# STARTUP PROFILE
+# =============================================================================
+# Every stage of a dataset build (FTP listing, each RETR, read_excel, EURING
+# and club300 pages, to_datetime, star schema, snapshot) runs inside
+# `with stage("name") as s:` and records wall time, RSS change and whatever
+# the stage counts (s.add(bytes=...), s.set(rows_in=..., rows_out=...)).
+# birddatastore starts a report per build and writes it as JSON:
+#     cache/profile/startup.json           stages of the last build
+#     cache/profile/startup_history.jsonl  one summary line per build
+# Outside a report the stages cost next to nothing and record nothing.
+
+_report = None  # the running report - builds are serialized by birddatastore._build_lock
+_report_lock = threading.Lock()
+_local = threading.local()  # stack of open stages per thread, for the parent names
+
+
+def rss_bytes():
+    """Resident memory of this process, None where /proc is not available"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def report_file():
+    return cache_path("profile", "startup.json")  # resolved on use - importing creates no folders
+
+
+def history_file():
+    return cache_path("profile", "startup_history.jsonl")
+
+
+def _mb(value):
+    return None if value is None else round(value / 1e6, 1)
+
+
+class Stage:
+    """Counters of one stage - set() replaces values, add() sums them up (e.g. bytes per chunk)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.info = {}
+        self._lock = threading.Lock()  # RETR callbacks may count from several threads
+
+    def set(self, **values):
+        with self._lock:
+            self.info.update(values)
+
+    def add(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self.info[key] = self.info.get(key, 0) + value
+
+
+def record(name, wall_s, parent=None, rss_delta=None, started=None, **info):
+    """Adds a stage measured elsewhere, e.g. in a worker process.
+
+    `started` is its time.perf_counter() at the start - comparable across processes on Linux.
+    """
+    report = _report
+    if report is None:
+        return
+    started = time.perf_counter() - wall_s if started is None else started
+    entry = {"name": name, "parent": parent, "start_s": round(started - report["_t0"], 3),
+             "wall_s": round(wall_s, 3), "rss_delta_mb": _mb(rss_delta)}
+    entry.update(info)
+    with _report_lock:
+        report["stages"].append(entry)
+
+
+@contextmanager
+def stage(name, parent=None):
+    """Times the block as one stage of the running report; parent defaults to the enclosing stage"""
+    s = Stage(name)
+    if _report is None:
+        yield s
+        return
+    stack = _local.__dict__.setdefault("stack", [])
+    parent = parent if parent is not None else (stack[-1] if stack else None)
+    stack.append(name)
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        wall_s = time.perf_counter() - started
+        stack.pop()
+        rss_after = rss_bytes()
+        record(name, wall_s, parent, None if rss_before is None or rss_after is None else rss_after - rss_before,
+               started, **s.info)
+
+
+def start_report(label):
+    """Starts collecting stages for one build - keeps a report that is already running"""
+    global _report
+    if _report is not None:
+        return
+    _report = {"label": label, "pid": os.getpid(), "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+               "rss_start_mb": _mb(rss_bytes()), "stages": [], "_t0": time.perf_counter()}
+
+
+def finish_report(**summary):
+    """Stops collecting, writes the report files and returns the report (None if none was running)"""
+    global _report
+    report, _report = _report, None
+    if report is None:
+        return None
+    report["total_s"] = round(time.perf_counter() - report.pop("_t0"), 3)
+    report["rss_end_mb"] = _mb(rss_bytes())
+    report.update(summary)
+    report["stages"].sort(key=lambda entry: entry["start_s"])
+
+    try:
+        path = report_file()
+        with open(path + ".tmp", "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        os.replace(path + ".tmp", path)
+        top = {entry["name"]: entry["wall_s"] for entry in report["stages"] if entry["parent"] is None}
+        with open(history_file(), "a") as f:
+            f.write(json.dumps({key: report[key] for key in ("label", "started", "total_s", "rss_start_mb", "rss_end_mb")}
+                               | {"stages": top}, default=str) + "\n")
+        print(f"Startprofil: {report['total_s']:.1f} s, {len(report['stages'])} Stufen -> {path}")
+    except OSError as e:
+        print(f"Startprofil konnte nicht gespeichert werden: {e}")
+    return report
@@ -0,0 +1,103 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+from birdcache import cache_path
+
+# =============================================================================
+# SERVER-SIDE SESSIONS
+# =============================================================================
+# After the login the browser gets a signed, expiring token in an HttpOnly
+# cookie. The token names a session in the table below - what the client
+# keeps in its dcc.Store is never trusted. Sessions end after SESSION_IDLE
+# seconds without a request, at the latest after SESSION_MAX_AGE, or on logout.
+#
+# The table is a SQLite file in the cache directory, shared by all gunicorn
+# workers: a logout or an idle timeout seen by one worker holds for all of
+# them, and a token whose session is not in the table is refused. Set
+# BIRD_SECRET_KEY so all processes sign with the same key (without it,
+# workers preloaded from one master share the random key).
+
+SESSION_COOKIE = "bird_session"
+SESSION_IDLE = int(os.getenv("BIRD_SESSION_IDLE", str(30 * 60)))  # seconds without a request
+SESSION_MAX_AGE = int(os.getenv("BIRD_SESSION_MAX_AGE", str(12 * 3600)))  # seconds after the login
+SWEEP_INTERVAL = 60  # seconds between removals of expired sessions
+SEEN_RESOLUTION = 5  # seconds - the last request is written at most this often per session
+
+_serializer = URLSafeTimedSerializer(os.getenv("BIRD_SECRET_KEY") or secrets.token_hex(32), salt="bird-session")
+_local = threading.local()  # one connection per thread
+_last_sweep = 0.0
+
+
+def connection():
+    # connections do not survive a fork - every worker opens its own
+    if getattr(_local, "pid", None) != os.getpid():
+        con = sqlite3.connect(cache_path("sessions", "sessions.sqlite"), timeout=5, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")  # readers do not wait for the writers
+        con.execute("CREATE TABLE IF NOT EXISTS sessions "
+                    "(sid TEXT PRIMARY KEY, user TEXT NOT NULL, created REAL NOT NULL, seen REAL NOT NULL)")
+        _local.con, _local.pid = con, os.getpid()
+    return _local.con
+
+
+def sweep(con, now):
+    """Removes idle and too old sessions, at most every SWEEP_INTERVAL seconds per process"""
+    global _last_sweep
+    if now - _last_sweep < SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    con.execute("DELETE FROM sessions WHERE seen < ? OR created < ?", (now - SESSION_IDLE, now - SESSION_MAX_AGE))
+
+
+def create_session(username):
+    """Starts a session and returns its signed token"""
+    sid = secrets.token_urlsafe(16)
+    now = time.time()
+    connection().execute("INSERT INTO sessions VALUES (?, ?, ?, ?)", (sid, username, now, now))
+    return _serializer.dumps({"sid": sid, "user": username})
+
+
+def session_user(token):
+    """User name of a valid token, None if it is unsigned, expired, idle for too long or logged out"""
+    if not token:
+        return None
+    try:
+        sid = _serializer.loads(token, max_age=SESSION_MAX_AGE).get("sid")
+    except (BadSignature, SignatureExpired, AttributeError):
+        return None
+    now = time.time()
+    try:
+        con = connection()
+        sweep(con, now)
+        row = con.execute("SELECT user, seen FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        if row is None:  # logged out, expired or never issued
+            return None
+        username, seen = row
+        if now - seen > SESSION_IDLE:
+            con.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            return None
+        if now - seen > SEEN_RESOLUTION:
+            con.execute("UPDATE sessions SET seen = ? WHERE sid = ?", (now, sid))
+        return username
+    except sqlite3.Error as e:  # refuse rather than let anyone in
+        print(f"Sitzungstabelle nicht lesbar: {e}")
+        return None
+
+
+def end_session(token):
+    """Logs the token out - it is refused from now on by every worker, though its signature stays valid"""
+    try:
+        sid = _serializer.loads(token, max_age=SESSION_MAX_AGE)["sid"]
+    except (BadSignature, SignatureExpired, KeyError, TypeError):
+        return
+    connection().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+def session_count():
+    """Sessions with a request within SESSION_IDLE, over all workers"""
+    row = connection().execute("SELECT COUNT(*) FROM sessions WHERE seen >= ?", (time.time() - SESSION_IDLE,)).fetchone()
+    return row[0]
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+from birdcache import cache_path, process_lock
+from birdprofile import stage
+from birdstar import BirdStar
+from fdpdataload import close_ftp, connect_ftp, list_xlsx_files
+
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+# =============================================================================
+# SNAPSHOT OF THE RINGING STAR SCHEMA
+# =============================================================================
+# The output of prep_birddata() - fact table and dimensions - is stored as
+# uncompressed Feather files, so a restart can memory-map them instead of
+# downloading, parsing and merging again. The snapshot is keyed by a
+# fingerprint of the workbooks on the FTP server.
+#
+# The fact columns are loaded as read-only numpy views on the mapped file
+# (written as one Arrow chunk per column, so no concatenation copy). Every
+# gunicorn worker that loads the same snapshot - also after a refresh - reads
+# the same pages of the OS page cache instead of a private copy. The small
+# dimensions and each worker's RingCube cells are still private memory.
+
+SNAPSHOT_VERSION = 5  # bump whenever prep_birddata() changes its output columns or the file layout
+
+
+# paths are resolved on use - importing this module creates no folders
+def snapshot_file():
+    return cache_path("snapshot", "birddata.feather")
+
+
+def snapshot_meta_file():
+    return cache_path("snapshot", "birddata.json")
+
+
+def dimension_file(name):
+    return cache_path("snapshot", f"dim_{name}.feather")
+
+
+def mapped_frame(table):
+    """DataFrame of zero-copy views on the columns of a memory-mapped Arrow table.
+
+    Columns that cannot be viewed (several chunks, nulls, strings) are converted - and copied.
+    """
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        try:
+            if column.num_chunks != 1:
+                raise ValueError("several chunks")
+            columns[name] = pd.Series(column.chunk(0).to_numpy(zero_copy_only=True), name=name, copy=False)
+        except Exception:  # pyarrow.ArrowInvalid or the ValueError above
+            columns[name] = column.to_pandas()
+    return pd.DataFrame(columns, copy=False)
+
+
+def source_fingerprint():
+    """Hashes name, size and modification time of all workbooks on the FTP server"""
+    ftp = connect_ftp()
+    try:
+        listing = list_xlsx_files(ftp)
+    finally:
+        close_ftp(ftp)
+    payload = json.dumps({"version": SNAPSHOT_VERSION, "files": listing}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_snapshot(fingerprint=None):
+    """Memory-maps the stored snapshot, or returns None if it is missing or outdated.
+
+    The fact table is a view on the mapped file (see mapped_frame), the dimensions are copied.
+    Without a fingerprint (e.g. FTP not reachable) any existing snapshot is used.
+    """
+    fact_file, meta_file = snapshot_file(), snapshot_meta_file()
+    if feather is None or not os.path.exists(fact_file) or not os.path.exists(meta_file):
+        return None
+    with open(meta_file, "r") as f:
+        meta = json.load(f)
+    if meta.get("version") != SNAPSHOT_VERSION or (fingerprint is not None and meta.get("fingerprint") != fingerprint):
+        print("Snapshot veraltet, Daten werden neu geladen.")
+        return None
+
+    with stage("snapshot_load") as s:
+        fact = mapped_frame(feather.read_table(fact_file, memory_map=True))
+        dims = {name: feather.read_table(dimension_file(name), memory_map=True).to_pandas()
+                for name in meta.get("dimensions", [])}
+        s.set(rows_out=len(fact), bytes=sum(os.path.getsize(path) for path in
+                                            [fact_file] + [dimension_file(name) for name in dims]))
+    print(f"Snapshot vom {meta.get('created')} geladen ({len(fact)} Zeilen).")
+    return BirdStar(fact, dims)
+
+
+def save_snapshot(star, fingerprint):
+    """Stores fact table and dimensions together with the fingerprint of their sources"""
+    if feather is None:
+        return
+    meta_file = snapshot_meta_file()
+    tables = {snapshot_file(): star.fact}
+    tables.update({dimension_file(name): dim for name, dim in star.dims.items()})
+    try:
+        with stage("snapshot_save") as s:
+            for path, df in tables.items():
+                # uncompressed and one chunk per column = viewable in place after mapping
+                feather.write_feather(df.reset_index(drop=True), path + ".tmp", compression="uncompressed",
+                                      chunksize=max(1, len(df)))
+                s.add(bytes=os.path.getsize(path + ".tmp"))
+            s.set(rows_in=len(star.fact))
+    except Exception as e:  # e.g. mixed-type object columns from Excel
+        print(f"Snapshot konnte nicht gespeichert werden: {e}")
+        for path in tables:
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+        return
+    if os.path.exists(meta_file):
+        os.remove(meta_file)  # never pair new data files with an old fingerprint
+    for path in tables:
+        os.replace(path + ".tmp", path)
+
+    meta = {"fingerprint": fingerprint, "version": SNAPSHOT_VERSION,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"), "rows": len(star.fact),
+            "dimensions": list(star.dims)}
+    with open(meta_file + ".tmp", "w") as f:
+        json.dump(meta, f, indent=4)
+    os.replace(meta_file + ".tmp", meta_file)
+
+
+def try_source_fingerprint():
+    """source_fingerprint(), or None if the FTP server cannot be reached"""
+    with stage("fingerprint"):
+        try:
+            return source_fingerprint()
+        except Exception as e:
+            print(f"FTP-Verzeichnis nicht lesbar: {e}")
+            return None
+
+
+def load_or_build(build, fingerprint):
+    """Returns the snapshot if it matches the fingerprint, otherwise runs build() and stores the result.
+
+    A fingerprint of None (FTP not reachable) accepts any existing snapshot.
+    Several workers refreshing at once build only once - the others wait and load the snapshot.
+    """
+    star = load_snapshot(fingerprint)
+    if star is not None:
+        return star
+
+    with process_lock("snapshot"):
+        star = load_snapshot(fingerprint)  # another worker may have built it while we waited
+        if star is not None:
+            return star
+        star = build()
+        if fingerprint is not None:
+            save_snapshot(star, fingerprint)
+            # the built frame is private to this worker - the mapped snapshot is shared with the others
+            star = load_snapshot(fingerprint) or star
+    return star
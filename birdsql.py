@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from birdcache import cache_path, process_lock
+from birdcube import month_index, period_labels
+from birdprofile import stage
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# =============================================================================
+# SQL BACKEND FOR THE DASHBOARD QUERIES
+# =============================================================================
+# Optional replacement for RingCube (BIRD_QUERY_BACKEND=sql): the star schema
+# is written once into an embedded database file and every callback query
+# runs there. All workers open the same file read-only instead of each
+# holding the ringing data in memory. DuckDB is used if it is installed,
+# otherwise SQLite from the standard library - the SQL works on both.
+
+QUERY_BACKEND = os.getenv("BIRD_QUERY_BACKEND", "cube")  # "cube" (in memory) or "sql"
+SQL_ENGINE = os.getenv("BIRD_SQL_ENGINE", "duckdb" if duckdb is not None else "sqlite")
+SQL_VERSION = 1  # bump whenever the tables below change
+
+
+# label column -> SQL expression, 'period' depends on the aggregation level
+LABEL_SQL = {'Name': 's.Name', 'strPlaceCode': 'p.strPlaceCode'}
+
+FROM_SQL = """
+    FROM fact f
+    LEFT JOIN species s ON s.species_key = f.species_key
+    LEFT JOIN place p ON p.place_key = f.place_key
+"""
+
+
+def database_file(engine=SQL_ENGINE):
+    return cache_path("sql", f"birddata.{engine}")
+
+
+def sql_meta_file():
+    return cache_path("sql", "birddata.json")
+
+
+def sql_tables(star):
+    """The tables of the database - fact rows with month and year, one label per dimension key"""
+    fact = star.fact
+    month = month_index(fact['Fangtag'])
+    tables = {
+        'fact': pd.DataFrame({
+            'pos': range(len(fact)),  # row order = date order, for the order of first ringing
+            'fangtag': fact['Fangtag'].astype('int64'),  # nanoseconds - plain integers in both engines
+            'month': month,
+            'year': month // 12,
+            'species_key': fact['species_key'].astype('int32'),
+            'place_key': fact['place_key'].astype('int32'),
+            'ring_key': fact['ring_key'].astype('int32'),
+        }),
+    }
+    for table, (dim, label) in {'species': ('species', 'Name'), 'place': ('place', 'strPlaceCode')}.items():
+        values = star.dims[dim][label].astype(object)
+        tables[table] = pd.DataFrame({f'{table}_key': range(len(values)),
+                                      label: values.where(values.notna(), None).map(lambda v: v if v is None else str(v))})
+    return tables
+
+
+def write_database(star, path, engine=SQL_ENGINE):
+    """Writes the tables into a new database file and swaps it in atomically"""
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    tables = sql_tables(star)
+    if engine == "duckdb":
+        con = duckdb.connect(tmp_file)
+        for name, df in tables.items():
+            con.register("source", df)
+            con.execute(f"CREATE TABLE {name} AS SELECT * FROM source")
+            con.unregister("source")
+        con.close()
+    else:
+        con = sqlite3.connect(tmp_file)
+        for name, df in tables.items():
+            df.to_sql(name, con, index=False)
+        con.execute("CREATE INDEX fact_fangtag ON fact (fangtag)")  # DuckDB's zone maps do this by itself
+        con.commit()
+        con.close()
+    os.replace(tmp_file, path)
+
+
+def open_sql_cube(build, fingerprint, engine=SQL_ENGINE):
+    """SqlCube on the shared database file - build() (the star schema) only runs if the file is outdated.
+
+    Like the snapshot, a fingerprint of None (FTP not reachable) accepts any existing file.
+    """
+    path, meta_file = database_file(engine), sql_meta_file()
+    with process_lock("sql"):  # one worker writes the file, the others wait and open it
+        meta = {}
+        if os.path.exists(meta_file):
+            with open(meta_file, "r") as f:
+                meta = json.load(f)
+        current = (os.path.exists(path) and meta.get("version") == SQL_VERSION and meta.get("engine") == engine
+                   and (fingerprint is None or meta.get("fingerprint") == fingerprint))
+        if not current:
+            star = build()
+            if os.path.exists(meta_file):
+                os.remove(meta_file)  # never pair a new database with an old fingerprint
+            with stage("sql_write") as s:
+                write_database(star, path, engine)
+                s.set(rows_in=len(star.fact), engine=engine, bytes=os.path.getsize(path))
+            meta = {"fingerprint": fingerprint, "version": SQL_VERSION, "engine": engine,
+                    "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+            with open(meta_file + ".tmp", "w") as f:
+                json.dump(meta, f, indent=4)
+            os.replace(meta_file + ".tmp", meta_file)
+    print(f"SQL-Datenbank ({engine}) vom {meta.get('created')}: {path}")
+    return SqlCube(path, engine)
+
+
+class SqlCube:
+    """Same queries as RingCube (count_rings, labels), answered by the database file"""
+
+    def __init__(self, path, engine=SQL_ENGINE):
+        self.path = path
+        self.engine = engine
+        self.local = threading.local()  # one read-only connection per thread
+
+        # sorted label lists, the categories of the result columns like in RingCube
+        self.categories = {
+            label: pd.Index(self.query(f"SELECT DISTINCT {label} FROM {table} WHERE {label} IS NOT NULL "
+                                       f"ORDER BY {label}")[label])
+            for label, table in (('Name', 'species'), ('strPlaceCode', 'place'))
+        }
+        self.size = int(self.query("SELECT COUNT(*) AS n FROM fact")['n'].iloc[0])
+
+    def connection(self):
+        # connections do not survive a fork - a preloaded gunicorn worker opens its own
+        if getattr(self.local, "pid", None) != os.getpid():
+            if self.engine == "duckdb":
+                self.local.con = duckdb.connect(self.path, read_only=True)
+            else:
+                self.local.con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self.local.pid = os.getpid()
+        return self.local.con
+
+    def query(self, sql, params=()):
+        con = self.connection()
+        if self.engine == "duckdb":
+            return con.execute(sql, list(params)).fetchdf()
+        return pd.read_sql_query(sql, con, params=list(params))
+
+    def where(self, columns, start, end, names, places):
+        """WHERE clause and parameters of a selection - rows without label in `columns` are left out"""
+        conditions, params = ["f.ring_key >= 0"], []
+        conditions += [f"{LABEL_SQL[column]} IS NOT NULL" for column in columns if column in LABEL_SQL]
+        if start is not None:
+            conditions.append("f.fangtag >= ?")
+            params.append(int(pd.Timestamp(start).value))
+        if end is not None:
+            conditions.append("f.fangtag <= ?")
+            params.append(int(pd.Timestamp(end).value))
+        for label, values in (('Name', names), ('strPlaceCode', places)):
+            if values is not None:
+                values = list(values)
+                conditions.append(f"{LABEL_SQL[label]} IN ({', '.join('?' * len(values))})" if values else "1 = 0")
+                params += [str(value) for value in values]
+        return " AND ".join(conditions), params
+
+    @staticmethod
+    def expression(column, freq):
+        return ('f.month' if freq == 'M' else 'f.year') if column == 'period' else LABEL_SQL[column]
+
+    def count_rings(self, by, start=None, end=None, names=None, places=None, freq='M'):
+        """Unique rings grouped by `by` (subset of 'period', 'strPlaceCode', 'Name') - see RingCube.count_rings"""
+        where, params = self.where(by, start, end, names, places)
+        columns = ", ".join(f"{self.expression(column, freq)} AS {column}" for column in by)
+        counts = self.query(f"SELECT {columns}, COUNT(DISTINCT f.ring_key) AS UniqueBirdCount {FROM_SQL} "
+                            f"WHERE {where} GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}", params)
+        counts['UniqueBirdCount'] = counts['UniqueBirdCount'].astype('int64')
+        for column in by:
+            if column == 'period':
+                counts['period'] = period_labels(counts['period'].astype('int64'), freq)
+            else:
+                counts[column] = pd.Categorical(counts[column], categories=self.categories[column])
+        return counts
+
+    def labels(self, label):
+        """Distinct labels in order of their first ringing - see RingCube.labels"""
+        expression = LABEL_SQL[label]
+        rows = self.query(f"SELECT {expression} AS label {FROM_SQL} WHERE {expression} IS NOT NULL "
+                          f"GROUP BY {expression} ORDER BY MIN(f.pos)")
+        return rows['label'].tolist()
@@ -0,0 +1,133 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# STAR SCHEMA OF THE RINGING DATA
+# =============================================================================
+# The fact table keeps one row per ringing with the date and an integer
+# surrogate key per dimension (-1 = no value). Codes and labels live once per
+# key in the dimension tables, indexed by that key. Labels are looked up only
+# for the rows that end up in a figure (see RingCube.count_rings).
+#
+# A new breakdown (age, sex, catching method, ...) needs its column in the
+# tblRinging schema (fdpdataload.WORKBOOK_SCHEMAS) and an entry below.
+
+# fact column -> (surrogate key column, dimension name, lookup table from get_ftp_data's dim_dfs)
+FACT_DIMENSIONS = {
+    'strSpecies': ('species_key', 'species', None),  # names come from the EURING/club300 species dimension
+    'strPlaceCode': ('place_key', 'place', 'df_place_code'),
+    'strRingNr': ('ring_key', 'ring', None),
+}
+
+# label column used by the dashboards -> dimension holding it
+LABEL_DIMENSIONS = {
+    'strSpecies': 'species', 'Name': 'species', 'NameGER': 'species', 'NameENG': 'species', 'NameLAT': 'species',
+    'strPlaceCode': 'place',
+    'strRingNr': 'ring',
+}
+
+# label shown for key -1 (no value in the ringing row) - NaN for all others
+MISSING_LABELS = {'NameLAT': "Latin Name missing"}
+
+BirdStar = namedtuple('BirdStar', ['fact', 'dims'])
+
+
+def build_dimension(codes, column, lookup=None):
+    """Surrogate keys for the fact column `codes` and the dimension table indexed by them.
+
+    The lookup table (a TLKP workbook) adds its columns as labels, matched on the
+    column of the same name. Keys follow the sorted codes, so key order is label order.
+    """
+    keys, uniques = pd.factorize(codes, sort=True)
+    dim = pd.DataFrame({column: uniques})
+    if lookup is not None:
+        if column in lookup.columns:
+            labels = lookup.drop_duplicates(column).set_index(column)
+            for name in labels.columns:
+                values = labels[name].reindex(uniques).to_numpy()
+                # Excel lookup columns may mix numbers and text - stored as text for the snapshot
+                dim[name] = pd.array(values, dtype='string') if labels[name].dtype == object else values
+        else:
+            print(f"⚠️ Spalte '{column}' fehlt in der Nachschlagetabelle, nur Codes verfügbar.")
+    return keys.astype(key_dtype(len(dim))), dim
+
+
+def key_dtype(size):
+    """Smallest signed integer type for `size` keys and -1 - a few species need one byte per row"""
+    for dtype in ('int8', 'int16', 'int32'):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return 'int64'
+
+
+def build_star(df, dim_dfs=None, label_builders=None):
+    """Splits the ringing rows into the fact table and its dimensions.
+
+    `dim_dfs` are the lookup tables from get_ftp_data(), `label_builders` maps a
+    dimension name to a function that returns extra label columns for its codes
+    (e.g. the species names).
+    """
+    dim_dfs = dim_dfs or {}
+    label_builders = label_builders or {}
+    mem_before = df.memory_usage(deep=True).sum()
+
+    # sorted by date, so date ranges are found by binary search (date_bounds)
+    df = df.sort_values('Fangtag', kind='stable', ignore_index=True)
+    fact = pd.DataFrame({'Fangtag': df['Fangtag'].astype('datetime64[ns]')})
+    dims = {}
+    for column, (key, name, lookup) in FACT_DIMENSIONS.items():
+        fact[key], dim = build_dimension(df[column], column, dim_dfs.get(lookup) if lookup else None)
+        if name in label_builders:
+            dim = dim.join(label_builders[name](dim[column]))
+        dims[name] = dim
+
+    mem_after = fact.memory_usage(deep=True).sum() + sum(dim.memory_usage(deep=True).sum() for dim in dims.values())
+    print(f"Speicher birddata: {mem_before / 1e6:.1f} MB -> {mem_after / 1e6:.1f} MB "
+          f"(Fakten {len(fact)} Zeilen, Dimensionen {', '.join(f'{n} {len(d)}' for n, d in dims.items())})")
+    return BirdStar(fact, dims)
+
+
+def key_column(label):
+    """Fact column holding the surrogate key for a label column, e.g. 'Name' -> 'species_key'"""
+    dim = LABEL_DIMENSIONS[label]
+    return next(key for key, name, _ in FACT_DIMENSIONS.values() if name == dim)
+
+
+def label_codes(star, label):
+    """(code per surrogate key, labels) - equal labels share a code, so they group together"""
+    codes, labels = pd.factorize(star.dims[LABEL_DIMENSIONS[label]][label], sort=True)
+    return codes.astype('int32'), labels
+
+
+def keys_for(star, label, values):
+    """Surrogate keys of the dimension rows whose label is in `values`"""
+    dim = star.dims[LABEL_DIMENSIONS[label]]
+    return dim.index[dim[label].isin(values)].to_numpy()
+
+
+def resolve(star, label, keys):
+    """Labels for an array of surrogate keys, MISSING_LABELS (default NaN) for -1"""
+    labels = star.dims[LABEL_DIMENSIONS[label]][label]
+    keys = np.asarray(keys)
+    values = labels.to_numpy(dtype=object)[keys]
+    values[keys < 0] = MISSING_LABELS.get(label, np.nan)
+    return values
+
+
+def labels_in_use(star, label):
+    """Distinct labels in order of their first ringing (like df[label].unique(), without NaN)"""
+    codes, labels = label_codes(star, label)
+    keys = star.fact[key_column(label)].to_numpy()
+    used = pd.unique(codes[keys[keys >= 0]])
+    return [labels[code] for code in used if code >= 0]
+
+
+def denormalize(star, rows=None, labels=('Name', 'strPlaceCode', 'strRingNr')):
+    """Wide frame with resolved labels - only for the given fact rows (all if None)"""
+    fact = star.fact if rows is None else star.fact.iloc[rows]
+    wide = fact[['Fangtag']].copy()
+    for label in labels:
+        wide[label] = resolve(star, label, fact[key_column(label)].to_numpy())
+    return wide
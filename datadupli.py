@@ -1,35 +1,202 @@
+import argparse
+import time
 
 import pandas as pd
 import numpy as np
 
 # Function to randomly duplicate rows and increment BirdID (based on current distribution)
 def random_duplicate_and_increment_birdid(df, max_duplicates=20, seed=None):
-    if seed is not None:
-        np.random.seed(seed)  # Optional: Set seed for reproducibility
+    rng = np.random.default_rng(seed)  # Optional: seed for reproducibility
 
     # Generate a random number of duplicates for each row, based on the distribution of current data
-    repeat_counts = np.random.randint(1, max_duplicates + 1, size=len(df))
-    
+    repeat_counts = rng.integers(1, max_duplicates + 1, size=len(df))
+
     # Repeat rows based on the random counts
     duplicated_df = df.loc[df.index.repeat(repeat_counts)].reset_index(drop=True)
-    
+
     # Update BirdID with a continuous sequence
     duplicated_df['BirdID'] = np.arange(1, len(duplicated_df) + 1)
-    
+
     return duplicated_df, repeat_counts
 
 
 # Generate additional random dates to spread out catches more evenly over the year
 def generate_additional_dates(df, period_start, period_end, n_extra=2000, seed=None):
-    if seed is not None:
-        np.random.seed(seed)
-    
+    rng = np.random.default_rng(seed)
+
     # Create random additional date range from the original data
     date_range = pd.date_range(start=period_start, end=period_end, freq='D')
-    extra_dates = np.random.choice(date_range, size=n_extra, replace=True)
-    
+    extra_dates = rng.choice(date_range.values, size=n_extra, replace=True)
+
     # Create new data entries with random dates
-    additional_data = df.sample(n=n_extra, replace=True).copy()
+    additional_data = df.sample(n=n_extra, replace=True, random_state=rng).copy()
     additional_data['DateTimeID'] = extra_dates
     additional_data['BirdID'] = np.arange(len(df)+1, len(df)+n_extra+1)  # New unique BirdIDs
     return pd.concat([df, additional_data], ignore_index=True)
+
+# =============================================================================
+# SYNTHETIC RINGING DATA (tblRinging)
+# =============================================================================
+# Generates ringing rows shaped like tblRinging (Fangtag, strSpecies,
+# strPlaceCode, strRingNr) for load tests, without touching the real data.
+# The rows are produced in date order, chunk by chunk, and appended to one
+# Parquet file - memory stays at one chunk, whatever the total size:
+#     python datadupli.py --rows 10000000 --out cache/synthetic_ringing.parquet
+#
+# A recapture reuses a ring issued in an earlier row. Species and place of a ring
+# are derived from its number by a hash, so a recaptured bird keeps its
+# species (and usually its place) without a table of all rings issued so far.
+
+# common EURING species codes of German ringing stations with rough shares
+DEFAULT_SPECIES = {
+    12770: 14, 10990: 10, 14640: 8, 14620: 7, 13110: 6, 12510: 6, 11870: 5, 16360: 4, 12430: 4, 13120: 4,
+    10660: 3, 10840: 3, 12000: 3, 13140: 3, 12760: 3, 9920: 3, 15910: 2, 15980: 2, 14370: 2, 16490: 2,
+}
+# ringing per month: spring and autumn migration (Jan..Dec)
+MONTH_WEIGHTS = np.array([1, 1, 3, 6, 6, 5, 5, 8, 12, 10, 4, 1], dtype=float)
+
+RING_PREFIX = "SYN"
+RECAPTURE_SHARE = 0.2  # share of rows that are recaptures of earlier rings
+RECAPTURE_LAG = 0.1  # mean age of a recaptured ring as share of the rings issued so far
+OTHER_PLACE_SHARE = 0.05  # recaptures away from the ringing place
+
+
+def ringing_profile(df_ringing):
+    """Species and place shares of a ringing frame - only counts, safe to pass on instead of the data"""
+    species = df_ringing['strSpecies'].dropna().value_counts(normalize=True)
+    places = df_ringing['strPlaceCode'].dropna().astype(str).value_counts(normalize=True)
+    return {'species': species.to_dict(), 'places': places.to_dict()}
+
+
+def default_profile(n_places=100):
+    """Profile without real data: DEFAULT_SPECIES and n_places place codes with Zipf-like shares"""
+    place_weights = 1.0 / np.arange(1, n_places + 1)
+    return {'species': DEFAULT_SPECIES,
+            'places': {f"SYN{i:04d}": w for i, w in enumerate(place_weights)}}
+
+
+def _hash_unit(ids, salt):
+    """Deterministic values in [0, 1) per ring id (splitmix64)"""
+    with np.errstate(over='ignore'):
+        z = ids.astype(np.uint64) + np.uint64(salt) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def _pick(ids, salt, cumulative):
+    """Index into a cumulative share table, fixed per ring id"""
+    return np.minimum(np.searchsorted(cumulative, _hash_unit(ids, salt), side='right'), len(cumulative) - 1)
+
+
+def _cumulative(shares):
+    weights = np.asarray(list(shares.values()), dtype=float)
+    return np.cumsum(weights / weights.sum())
+
+
+def _ring_numbers(ids):
+    return RING_PREFIX + pd.Series(ids).astype(str).str.zfill(9)
+
+
+def _chunk_dates(rng, n, start, end):
+    """n sorted dates between start and end, more in the migration months"""
+    days = pd.date_range(start, max(start, end), freq='D')  # at least one day, also for very small chunks
+    weights = MONTH_WEIGHTS[days.month - 1]
+    picked = rng.choice(len(days), size=n, p=weights / weights.sum())
+    picked.sort()
+    return days.values[picked]
+
+
+def synthetic_ringing_chunks(rows, start='2000-01-01', end='2024-12-31', chunk_rows=1_000_000, profile=None,
+                             recapture_share=RECAPTURE_SHARE, seed=None):
+    """Yields tblRinging-shaped frames of at most chunk_rows rows, in date order"""
+    rng = np.random.default_rng(seed)
+    salt = int(rng.integers(1 << 62))  # species/place per ring differ between seeds
+    profile = profile or default_profile()
+    species_codes = np.asarray(list(profile['species']))
+    place_codes = np.asarray([str(p) for p in profile['places']], dtype=object)
+    species_cum, place_cum = _cumulative(profile['species']), _cumulative(profile['places'])
+
+    n_chunks = max(1, -(-rows // chunk_rows))
+    bounds = pd.date_range(start, end, periods=n_chunks + 1).normalize()
+    issued = 0  # ring ids 0..issued-1 exist
+    for i in range(n_chunks):
+        n = min(chunk_rows, rows - i * chunk_rows)
+        dates = _chunk_dates(rng, n, bounds[i], bounds[i + 1] - pd.Timedelta(days=1) if i + 1 < n_chunks else bounds[i + 1])
+
+        # recaptures only of rings issued in an earlier row, so they never come before the ringing
+        recapture = rng.random(n) < recapture_share
+        recapture[0] &= issued > 0
+        new = ~recapture
+        available = issued + np.cumsum(new) - new  # rings issued before each row
+        ids = np.empty(n, dtype=np.int64)
+        n_new = int(new.sum())
+        ids[new] = np.arange(issued, issued + n_new)
+        pool = available[recapture]
+        lag = rng.exponential(np.maximum(1.0, RECAPTURE_LAG * pool)).astype(np.int64)
+        ids[recapture] = pool - 1 - np.minimum(lag, pool - 1)
+        issued += n_new
+
+        places = _pick(ids, salt + 1, place_cum)
+        moved = recapture & (rng.random(n) < OTHER_PLACE_SHARE)
+        places[moved] = rng.choice(len(place_codes), size=int(moved.sum()), p=np.diff(place_cum, prepend=0.0))
+        yield pd.DataFrame({
+            'Fangtag': dates,
+            'strSpecies': species_codes[_pick(ids, salt, species_cum)],
+            'strPlaceCode': pd.Categorical.from_codes(places, categories=place_codes),
+            'strRingNr': pd.array(_ring_numbers(ids), dtype='string'),
+        })
+
+
+def write_synthetic_ringing(path, rows, **kwargs):
+    """Writes synthetic_ringing_chunks() into one Parquet file, one row group per chunk"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    written = 0
+    try:
+        for chunk in synthetic_ringing_chunks(rows, **kwargs):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+            writer.write_table(table.cast(writer.schema))
+            written += len(chunk)
+            print(f"{written:,} / {rows:,} Zeilen geschrieben")
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+
+def read_synthetic_ringing(path):
+    """Reads a generated file back with the dtypes of get_ringing_data()"""
+    df = pd.read_parquet(path)
+    df['Fangtag'] = df['Fangtag'].astype('datetime64[ns]')
+    df['strPlaceCode'] = df['strPlaceCode'].astype(str).astype('category')
+    df['strRingNr'] = df['strRingNr'].astype('string')
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Erzeugt synthetische Beringungsdaten (tblRinging) als Parquet")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--out", default="synthetic_ringing.parquet")
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000)
+    parser.add_argument("--start", default="2000-01-01")
+    parser.add_argument("--end", default="2024-12-31")
+    parser.add_argument("--places", type=int, default=100, help="Anzahl Beringungsorte")
+    parser.add_argument("--recaptures", type=float, default=RECAPTURE_SHARE, help="Anteil Wiederfänge")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = write_synthetic_ringing(args.out, args.rows, start=args.start, end=args.end, chunk_rows=args.chunk_rows,
+                                   profile=default_profile(args.places), recapture_share=args.recaptures,
+                                   seed=args.seed)
+    print(f"{rows:,} Zeilen in {time.perf_counter() - started:.1f} s: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
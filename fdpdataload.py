@@ -1,11 +1,70 @@
 import os
-import io
-from ftplib import FTP_TLS
-from io import BytesIO
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ftplib import FTP_TLS, all_errors, error_perm
+from queue import Queue, Empty
 import pandas as pd
 
+from birdcache import cache_path
+from birdprofile import record, stage
 
-def get_ftp_data():
+try:
+    import python_calamine  # noqa: F401 - Rust Excel reader, pandas uses it as engine="calamine"
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
+# parallel FTP connections for downloads and worker processes for parsing the workbooks
+FTP_CONNECTIONS = int(os.getenv("BIRD_FTP_CONNECTIONS", "4"))
+PARSE_WORKERS = int(os.getenv("BIRD_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# the parse workers are started from the refresher thread of a multi-threaded server - forking
+# there could copy a lock held by another thread, so they start from a clean process instead
+PARSE_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# =============================================================================
+# EXPECTED WORKBOOKS
+# =============================================================================
+# Schema per workbook: the columns to read with their dtype (None = inferred)
+# and the columns to store as category. Without a schema the whole sheet is
+# read - fine for the small TLKP lookup tables.
+
+WORKBOOK_SCHEMAS = {
+    "TLKPCATCHINGLURES": None,
+    "TLKPAGE": None,
+    "TLKPSEX": None,
+    "tblRefer": None,
+    "TLKPACCURACYDATE": None,
+    "TLKPACCURACYPLACE": None,
+    "TLKPSPECIES": None,
+    "TLKPVERIFICATIONRING": None,
+    "TLKPSTATUSBROODSIZE": None,
+    "TLKPCATCHINGMETHODS": None,
+    "TLKPRELATION": None,
+    "TLKPRECOVERYCHANCES": None,
+    "tblGeoTab": None,
+    "TLKPRINGINGSCHEME": None,
+    "tblRinging": {
+        "columns": {
+            "Fangtag": None,  # parsed later with pd.to_datetime(errors="coerce")
+            "strSpecies": None,  # keep inferred type, it is joined with the EURING codes
+            "strPlaceCode": "string",
+            "strRingNr": "string",
+        },
+        "categorical": ["strPlaceCode"],
+    },
+    "TLKPCHANGESTORING": None,
+    "TLKPPLACECODE": None,
+    "TLKPFINDDETAILS": None,
+    "TLKPFINDCIRCUMSTANCES": None,
+    "tblOpen": None,
+    "TLKPFINDCONDITIONS": None,
+}
+
+
+def connect_ftp():
+    """Opens the encrypted FTP connection to the bird data server"""
     ftp_user = os.getenv("BIRD_FTP_USER")
     ftp_pw = os.getenv("BIRD_FTP_PW")
     ftp_host = os.getenv("BIRD_FTP_SERVER")
@@ -14,50 +73,196 @@ def get_ftp_data():
     ftp = FTP_TLS(ftp_host)
     ftp.login(ftp_user,ftp_pw)
     ftp.prot_p()  # activate encripted date transfer
+    return ftp
+
+
+def close_ftp(ftp):
+    """Says goodbye to the server - or just closes the socket if it already dropped the connection"""
+    try:
+        ftp.quit()
+    except all_errors:
+        ftp.close()
+
+
+def list_xlsx_files(ftp):
+    """Returns {filename: {"size": ..., "modify": ...}} for every workbook in the current ftp directory"""
+    with stage("ftp_list") as s:
+        workbooks = _list_xlsx_files(ftp)
+        s.set(files=len(workbooks))
+    return workbooks
+
+
+def _list_xlsx_files(ftp):
+    try:
+        listing = {name: facts for name, facts in ftp.mlsd(facts=["type", "size", "modify"])
+                   if facts.get("type", "file") == "file"}
+    except error_perm:
+        # server without MLSD - ask for every file separately
+        ftp.voidcmd("TYPE I")  # SIZE is only reliable in binary mode
+        listing = {}
+        for name in ftp.nlst():
+            if name.lower().endswith(".xlsx"):
+                listing[name] = {"size": str(ftp.size(name)), "modify": ftp.voidcmd(f"MDTM {name}")[4:].strip()}
+
+    return {name: {"size": facts.get("size"), "modify": facts.get("modify")}
+            for name, facts in listing.items() if name.lower().endswith(".xlsx")}
+
+
+def download_workbooks(jobs, connections=FTP_CONNECTIONS):
+    """Downloads [(filename, local path, size), ...] over several FTP connections at once"""
+    queue = Queue()
+    for job in sorted(jobs, key=lambda job: -int(job[2] or 0)):  # biggest first, small TLKPs fill the gaps
+        queue.put(job[:2])
+
+    def download_queued():
+        ftp = connect_ftp()  # FTP_TLS connections are not thread-safe - one per thread
+        try:
+            while True:
+                try:
+                    filename, local_file = queue.get_nowait()
+                except Empty:
+                    return
+                with stage(f"RETR {filename}", parent="ftp_download") as s, open(local_file + ".tmp", "wb") as f:
+                    def write(block):
+                        f.write(block)
+                        s.add(bytes=len(block))
+                    ftp.retrbinary(f"RETR {filename}", write)
+                os.replace(local_file + ".tmp", local_file)
+                print(f"⬇️ '{filename}' aktualisiert.")
+        finally:
+            close_ftp(ftp)
+
+    workers = max(1, min(connections, len(jobs)))
+    with stage("ftp_download") as s, ThreadPoolExecutor(max_workers=workers) as pool:
+        s.set(files=len(jobs), connections=workers, bytes=sum(int(job[2] or 0) for job in jobs))
+        for future in [pool.submit(download_queued) for _ in range(workers)]:
+            future.result()  # re-raise download errors
+
+
+def sync_xlsx_files(incremental=True):
+    """Downloads only new or changed workbooks into the local cache.
 
-    file_list = ftp.nlst() # lists of all files in the current ftp directory
+    Size and modification time of every remote workbook are compared with the
+    manifest of the last sync. Returns {filename: local path} for all workbooks.
+    With incremental=False every workbook is downloaded again.
+    """
+    # the listing connection is closed before the downloads - idle, it could time out meanwhile
+    ftp = connect_ftp()
+    try:
+        remote_files = list_xlsx_files(ftp)
+        print("Aktuelles Verzeichnis:", ftp.pwd())
+    finally:
+        close_ftp(ftp)
+    print("Inhalt:", list(remote_files))
 
-    print("Aktuelles Verzeichnis:", ftp.pwd())
-    print("Inhalt:", file_list)
+    manifest_file = cache_path("ftp", "manifest.json")
+    manifest = {}
+    if incremental and os.path.exists(manifest_file):
+        with open(manifest_file, "r") as f:
+            manifest = json.load(f)
 
-    xlsx_files = [f for f in file_list if f.lower().endswith(".xlsx")]
+    local_files = {}
+    jobs = []
+    for filename, facts in remote_files.items():
+        local_file = cache_path("ftp", filename)
+        unknown = facts["size"] is None and facts["modify"] is None  # server told us nothing - always load
+        if unknown or manifest.get(filename) != facts or not os.path.exists(local_file):
+            jobs.append((filename, local_file, facts["size"]))
+        local_files[filename] = local_file
 
-    dataframes = {}
+    if jobs:
+        download_workbooks(jobs)
 
-    for filename in xlsx_files:
-        if filename.endswith(".xlsx"):
-            with io.BytesIO() as buffer:
-                ftp.retrbinary(f"RETR {filename}", buffer.write)
-                buffer.seek(0)
-                df = pd.read_excel(buffer)
-                key_name = filename.rsplit(".", 1)[0]
-                dataframes[key_name] = df
+    manifest = {filename: facts for filename, facts in remote_files.items()}
+    with open(manifest_file + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_file + ".tmp", manifest_file)
+
+    return local_files
+
+
+def read_columns_streaming(local_file, columns):
+    """Streams the first sheet row by row and keeps only the given columns"""
+    from openpyxl import load_workbook  # imported on use - keeps the module import cheap
+    wb = load_workbook(local_file, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        wanted = [(i, name) for i, name in enumerate(header) if name in columns]
+        data = {name: [] for _, name in wanted}
+        for row in rows:
+            values = [row[i] if i < len(row) else None for i, _ in wanted]
+            if all(value is None for value in values):
+                continue  # empty row - pandas skips those as well
+            for (_, name), value in zip(wanted, values):
+                data[name].append(value)
+    finally:
+        wb.close()
+    return pd.DataFrame(data)
+
+
+def read_workbook(local_file, schema=None):
+    """Parses one workbook - module level so it can run in a worker process.
+
+    With a schema only its columns are materialized, in the declared dtypes.
+    """
+    if schema is None:
+        return pd.read_excel(local_file, engine=EXCEL_ENGINE)
+
+    columns = schema["columns"]
+    if EXCEL_ENGINE == "calamine":
+        df = pd.read_excel(local_file, engine="calamine", usecols=lambda name: name in columns)
+    else:
+        df = read_columns_streaming(local_file, columns)
+
+    for name, dtype in columns.items():
+        if name not in df.columns:
+            print(f"⚠️ Spalte '{name}' fehlt in {os.path.basename(local_file)}.")
+        elif dtype is not None:
+            df[name] = df[name].astype(dtype)
+    for name in schema.get("categorical", []):
+        if name in df.columns:
+            df[name] = df[name].astype("category")
+    return df
+
+
+def read_workbook_timed(local_file, schema=None):
+    """read_workbook() with its start and duration - worker processes cannot add stages to the report"""
+    started = time.perf_counter()
+    df = read_workbook(local_file, schema)
+    return df, started, time.perf_counter() - started
+
+
+def read_workbooks(local_files, workers=PARSE_WORKERS):
+    """Parses {filename: local path} in parallel processes, openpyxl is CPU-bound and holds the GIL"""
+    filenames = list(local_files)
+    paths = [local_files[filename] for filename in filenames]
+    schemas = [WORKBOOK_SCHEMAS.get(filename.rsplit(".", 1)[0]) for filename in filenames]
+    with stage("read_excel") as s:
+        if workers <= 1 or len(paths) <= 1:
+            results = [read_workbook_timed(path, schema) for path, schema in zip(paths, schemas)]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(paths)),
+                                     mp_context=multiprocessing.get_context(PARSE_START_METHOD)) as pool:
+                results = list(pool.map(read_workbook_timed, paths, schemas))
+        s.set(files=len(paths), workers=workers, engine=EXCEL_ENGINE,
+              bytes=sum(os.path.getsize(path) for path in paths), rows_out=sum(len(df) for df, _, _ in results))
+    for filename, path, (df, started, seconds) in zip(filenames, paths, results):
+        record(f"read_excel {filename}", seconds, parent="read_excel", started=started,
+               bytes=os.path.getsize(path), rows_out=len(df), columns=len(df.columns))
+    return {filename.rsplit(".", 1)[0]: df for filename, (df, _, _) in zip(filenames, results)}
+
+
+def get_ftp_data(incremental=True):
+    with stage("ftp_sync") as s:
+        # unchanged workbooks come from the local cache, only changed ones are transferred
+        local_files = sync_xlsx_files(incremental=incremental)
+        s.set(files=len(local_files))
+    dataframes = read_workbooks(local_files)
 
     ftp_files = list(dataframes.keys())
 
-    expected_files = {
-        "TLKPCATCHINGLURES": None,
-        "TLKPAGE": None,
-        "TLKPSEX": None,
-        "tblRefer": None,
-        "TLKPACCURACYDATE": None,
-        "TLKPACCURACYPLACE": None,
-        "TLKPSPECIES": None,
-        "TLKPVERIFICATIONRING": None,
-        "TLKPSTATUSBROODSIZE": None,
-        "TLKPCATCHINGMETHODS": None,
-        "TLKPRELATION": None,
-        "TLKPRECOVERYCHANCES": None,
-        "tblGeoTab": None,
-        "TLKPRINGINGSCHEME": None,
-        "tblRinging": None,
-        "TLKPCHANGESTORING": None,
-        "TLKPPLACECODE": None,
-        "TLKPFINDDETAILS": None,
-        "TLKPFINDCIRCUMSTANCES": None,
-        "tblOpen": None,
-        "TLKPFINDCONDITIONS": None
-    }
+    expected_files = dict.fromkeys(WORKBOOK_SCHEMAS)
 
     # Überprüfe, ob erwartete Dateien schon geladen sind
     for key in expected_files:
@@ -67,8 +272,6 @@ def get_ftp_data():
         else:
             print(f"⚠️ '{key}' nicht gefunden.")
 
-    ftp.quit()  # Verbindung erst hier schließen
-
     # Beispielausgabe
     #for name, df in expected_files.items():
     #    if df is not None:
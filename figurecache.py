@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# =============================================================================
+# FIGURE CACHE
+# =============================================================================
+# Users switch between the same few selections a lot. Finished figures are kept
+# as plain dicts, keyed by the normalized callback inputs and the dataset
+# version, so a repeated selection skips aggregation and figure building.
+# Bounded by entries and by the size of the stored JSON - a figure over many
+# years weighs far more than one over a month, and every worker has its own.
+
+
+class FigureCache:
+    """Thread-safe LRU cache with time-to-live and hit/miss counters"""
+
+    def __init__(self, maxsize=128, ttl=600, maxbytes=64_000_000):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self._entries = OrderedDict()  # key -> (stored at, figure dict, size in bytes)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached figure dict or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)  # most recently used
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, fig):
+        """Stores a result (figures as dict) and returns what was stored"""
+        figure = fig.to_dict() if hasattr(fig, 'to_dict') else fig
+        size = len(json.dumps(figure, default=str))  # about what it costs in memory and on the wire
+        with self._lock:
+            self._remove(key)
+            if size > self.maxbytes:
+                return figure  # too big to keep - returned, not stored
+            self._entries[key] = (time.monotonic(), figure, size)
+            self.bytes += size
+            while len(self._entries) > self.maxsize or self.bytes > self.maxbytes:
+                self._remove(next(iter(self._entries)))  # least recently used
+        return figure
+
+    def _remove(self, key):
+        """Drops an entry - called with the lock held"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+figure_cache = FigureCache(maxsize=int(os.getenv("BIRD_FIGURE_CACHE_SIZE", "128")),
+                           ttl=int(os.getenv("BIRD_FIGURE_CACHE_TTL", "600")),
+                           maxbytes=int(os.getenv("BIRD_FIGURE_CACHE_MB", "64")) * 1_000_000)
+
+
+def selection_key(values):
+    """Normalizes a multi-select value - order does not matter and 'all' wins"""
+    if not values or 'all' in values:
+        return 'all'
+    return tuple(sorted(values))
+
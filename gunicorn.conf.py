@@ -0,0 +1,22 @@
+import os
+
+# =============================================================================
+# GUNICORN SETTINGS
+# =============================================================================
+# Read by `gunicorn wsgi:server`. Every worker serves several requests at once
+# in threads - pandas and the database release the GIL during the queries.
+
+bind = os.getenv("BIRD_BIND", "0.0.0.0:8050")
+workers = int(os.getenv("BIRD_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("BIRD_THREADS", "4"))
+timeout = 120
+
+# build the dataset once in the master, workers inherit it (see wsgi.py)
+preload_app = True
+
+
+def post_fork(server, worker):
+    """Threads do not survive the fork - every worker starts its own refresher"""
+    from birddatastore import start_refresher
+    start_refresher()
@@ -0,0 +1,18 @@
+import gc
+
+from app import app
+from birddatastore import get_dataset
+
+# =============================================================================
+# PRODUCTION ENTRY POINT
+# =============================================================================
+# gunicorn imports this module once in the master process (preload_app in
+# gunicorn.conf.py), so the dataset is built or loaded from the snapshot only
+# once. The forked workers share its memory copy-on-write instead of building
+# their own. Start with:
+#     gunicorn wsgi:server
+
+server = app.server  # the Flask WSGI application
+
+get_dataset()  # build now, before the workers are forked
+gc.freeze()  # keep the garbage collector from touching (and so copying) the shared objects in the workers
@@ -0,0 +1,77 @@
+import pandas as pd
+from dash.exceptions import PreventUpdate
+
+# =============================================================================
+# ZOOMED LEGEND TOTALS
+# =============================================================================
+# Unique birds cannot be summed over the visible bars, so the legend of a
+# zoomed chart is recounted on the server - only when the user zooms, once per
+# finished zoom gesture (plotly sends relayoutData on mouse up). The page only
+# keeps its bar categories and legend totals in the browser (zoom_info), the
+# callback answers with the totals of the visible bars. assets/zoom.js puts
+# them into the legend.
+
+
+def zoom_info(axis, x, totals, title):
+    """What the browser keeps for zooming: axis kind ('date', 'year', 'place'), bar categories, legend totals"""
+    return {'axis': axis, 'x': [str(value) for value in x], 'title': title,
+            'totals': {str(name): int(count) for name, count in totals.items()}}
+
+
+def zoom_range(relayout_data):
+    """[start, end] of a zoom, None if it was reset (double click) - PreventUpdate for other relayouts"""
+    relayout_data = relayout_data or {}
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
+    if 'xaxis.range' in relayout_data:
+        return list(relayout_data['xaxis.range'])
+    if 'xaxis.autorange' in relayout_data:
+        return None
+    raise PreventUpdate  # e.g. legend clicks - nothing to recount
+
+
+def visible_selection(info, zoom, start_date, end_date):
+    """Date range and places of the bars inside the zoom range.
+
+    Dates compare directly, category axes (years, places) are zoomed by position
+    in ascending category order. Returns None if no bar is visible.
+    """
+    start = None if start_date is None else pd.Timestamp(start_date)
+    end = None if end_date is None else pd.Timestamp(end_date)
+    if info['axis'] == 'date':
+        # one bar per month, drawn at the month start
+        first = pd.Timestamp(zoom[0]).to_period('M').start_time
+        first = first if first >= pd.Timestamp(zoom[0]) else first + pd.offsets.MonthBegin()
+        last = pd.Timestamp(zoom[1]).to_period('M')
+        if first > last.start_time:
+            return None
+        start = first if start is None else max(start, first)
+        end = last.end_time if end is None else min(end, last.end_time)
+        return start, end, None
+
+    categories = sorted(info['x'])
+    visible = [x for i, x in enumerate(categories) if zoom[0] <= i <= zoom[1]]
+    if not visible:
+        return None
+    if info['axis'] == 'place':
+        return start, end, visible
+    first, last = pd.Period(visible[0], 'Y'), pd.Period(visible[-1], 'Y')
+    start = first.start_time if start is None else max(start, first.start_time)
+    end = last.end_time if end is None else min(end, last.end_time)
+    return start, end, None
+
+
+def zoom_totals(cube, info, relayout_data, start_date, end_date, names=None, places=None):
+    """Legend totals of the visible bars: {'range': zoom range or None, 'totals': {bird type: unique birds}}"""
+    zoom = zoom_range(relayout_data)
+    if zoom is None or not info:
+        return {'range': None, 'totals': None}  # reset - the browser has the totals of the whole chart
+    selection = visible_selection(info, zoom, start_date, end_date)
+    if selection is None:
+        return {'range': zoom, 'totals': {}}
+    start, end, visible_places = selection
+    if visible_places is not None:
+        places = visible_places if places is None else [place for place in visible_places if place in places]
+    counts = cube.count_rings(['Name'], start, end, names, places)
+    return {'range': zoom, 'totals': {str(name): int(count) for name, count in
+                                      zip(counts['Name'], counts['UniqueBirdCount'])}}